@@ -1,35 +1,76 @@
 #!/usr/bin/env python3.11
+'''
+Synthetic inventory for load testing the controller.
+
+Every host is local; the size of the inventory is set with arguments or environment variables:
+
+    --count      DYNAMIC_INVENTORY_COUNT      number of hosts (default 10)
+    --groups     DYNAMIC_INVENTORY_GROUPS     number of groups group_1..group_N the hosts are spread over (default 1)
+    --vars       DYNAMIC_INVENTORY_VARS       number of extra hostvars per host (default 0)
+    --var-size   DYNAMIC_INVENTORY_VAR_SIZE   length of the string in each extra hostvar (default 16)
+    --depth      DYNAMIC_INVENTORY_DEPTH      number of dictionaries each extra hostvar is nested in (default 0)
+
+The JSON document is written in chunks, so memory stays bounded however many hosts are
+generated. The defaults reproduce the original ten host inventory. --list and --host are
+answered from a cache, see inventory_cli.py.
+'''
+
+import argparse
 import json
+import os
+
+import inventory_cli
+
+
+def _hostvars(variables, var_size, depth):
+    '''
+        :return The hostvars shared by every host.
+    '''
+
+    hostvars = {'ansible_host': '127.0.0.1', 'ansible_connection': 'local'}
+
+    for n in range(variables):
+        value = 'x' * var_size
+        for level in range(depth, 0, -1):
+            value = {'level_{}'.format(level): value}
+        hostvars['var_{}'.format(n)] = value
+
+    return hostvars
+
+
+def _write_inventory(writer, args):
+    '''
+        Write the inventory described by the parsed arguments.
+        :param writer: An inventory_cli.InventoryWriter.
+    '''
+
+    count = args.count
+    groups = max(1, args.groups)
+
+    # every host has the same hostvars, so they are serialized once
+    hostvars = json.dumps(_hostvars(args.variables, args.var_size, args.depth))
 
-count = 10
+    writer.hostvars(('host_%d.local' % i, hostvars) for i in range(count))
+    writer.group('all', children=['ungrouped'])
+    writer.group('ungrouped', hosts=('"host_%d.local"' % i for i in range(count)))
 
-def _generate_inventory():
+    # host i is a member of group_(i % groups + 1)
+    for group in range(groups):
+        writer.group('group_%d' % (group + 1), hosts=('"host_%d.local"' % i for i in range(group, count, groups)))
 
-    ungrouped = ["host_{}.local".format(i) for i in range(count)]
 
-    hostvars = {}
-    for i in range(count):
-        name = "host_{}.local".format(i)
-        hostvars[name] = {'ansible_host': '', 'ansible_connection': ''}
-        hostvars[name]['ansible_host'] = '127.0.0.1'
-        hostvars[name]['ansible_connection'] = 'local'
+def _parser():
+    def default(name, value):
+        return int(os.environ.get('DYNAMIC_INVENTORY_' + name, value))
 
-    data = {
-        '_meta': {
-            'hostvars': hostvars
-        },
-        'all': {
-            'children': ['ungrouped']
-        },
-        'ungrouped': {
-            'hosts': ungrouped
-        },
-        "group_1": {
-            'hosts': ungrouped[0:10]
-        }
-    }
+    parser = argparse.ArgumentParser(description='Synthetic inventory for load testing.')
+    parser.add_argument('--count', type=int, default=default('COUNT', 10), help='number of hosts')
+    parser.add_argument('--groups', type=int, default=default('GROUPS', 1), help='number of groups the hosts are spread over')
+    parser.add_argument('--vars', dest='variables', type=int, default=default('VARS', 0), help='number of extra hostvars per host')
+    parser.add_argument('--var-size', type=int, default=default('VAR_SIZE', 16), help='length of the string in each extra hostvar')
+    parser.add_argument('--depth', type=int, default=default('DEPTH', 0), help='nesting depth of each extra hostvar')
+    return parser
 
-    return json.dumps(data)
 
 if __name__ == '__main__':
-    print(_generate_inventory())
+    inventory_cli.main(__file__, _write_inventory, _parser())
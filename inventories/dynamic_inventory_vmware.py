@@ -1,89 +1,233 @@
 #!/usr/bin/env python
+'''
+Simulated VMware/Azure fleet built from one hand-written virtual machine record.
 
-# this is just a template
+    --count   VMWARE_INVENTORY_COUNT   number of virtual machines (default 1)
 
+The first host is the template itself; every other host is a clone with its own name, ids,
+IPs and MAC address, spread over locations, OS types, resource groups and tags. All hosts are
+in the vmware group and in keyed groups by location, os_type and tag, like the azure_rm
+inventory plugin creates them.
+
+Every attribute of host i is picked by i modulo the number of choices, and the numbers of
+choices are coprime, so the members of a keyed group are every n-th host and no membership
+has to be stored. The nested objects clones have in common are serialized once.
+'''
+
+import argparse
 import json
+import os
+import re
+
+import inventory_cli
+
+TEMPLATE = {
+    "ansible_connection": "winrm",
+    "ansible_host": "localhost",
+    "ansible_host_ip": "127.0.0.1",
+    "ansible_port": 5985,
+    "availability_zone": None,
+    "computer_name": "localhost",
+    "creation_time": "2000-01-01T00:00:00.6666452+00:00",
+    "data_disks": [],
+    "default_inventory_hostname": "localhost",
+    "id": "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Compute/virtualMachines/localhost",
+    "image": {
+        "id": "/subscriptions/c32bd846-23ea-4b5d-96c6-c5a588a4f127/resourceGroups/RT-US-PRD-ARG-Operations/providers/Microsoft.Compute/galleries/TEST_GALLERY/images/TEST_WINDOWS_2019_SOE"
+    },
+    "location": "australiaeast",
+    "mac_address": [
+        "00-11-48-11-FC-0F"
+    ],
+    "name": "localhost",
+    "network_interface": [
+        "localhost-nic01"
+    ],
+    "network_interface_id": [
+        "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Network/networkInterfaces/localhost-nic01"
+    ],
+    "os_disk": {
+        "id": "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Compute/disks/localhost-OS-disk",
+        "name": "localhost-OS-disk",
+        "operating_system_type": "windows"
+    },
+    "os_profile": {
+        "system": "windows"
+    },
+    "os_type": "windows",
+    "plan": None,
+    "powerstate": "running",
+    "private_ip": "127.0.0.1",
+    "private_ipv4_addresses": [
+        "127.0.0.1"
+    ],
+    "provisioning_state": "Succeeded",
+    "public_dns_hostnames": [],
+    "public_ip": None,
+    "public_ip_id": None,
+    "public_ip_name": None,
+    "public_ipv4_addresses": [],
+    "resource_group": "TEST-localhost",
+    "resource_type": "Microsoft.Compute/virtualMachines",
+    "security_group": [],
+    "security_group_id": [],
+    "tags": {
+        "CompanyName": "EXAMPLE",
+        "CostCode": "91007200",
+        "CreatedDate": "1/01/2000 00:00:00 PM",
+        "Creator": "Admin",
+        "Environment": "Non Production",
+        "FinanceCode": "A111"
+    },
+    "type": "Microsoft.Compute/virtualMachines",
+    "virtual_machine_size": "Standard_B2ms",
+    "vmid": "50b66256-d378-411f-bf4c-9d5c6276facf",
+    "vmss": {}
+}
+
+SUBSCRIPTION = '/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4'
+GALLERY = '/subscriptions/c32bd846-23ea-4b5d-96c6-c5a588a4f127/resourceGroups/RT-US-PRD-ARG-Operations/providers/Microsoft.Compute/galleries/TEST_GALLERY/images/'
+
+# the choices of the template come first; the numbers of choices are pairwise coprime
+LOCATIONS = ['australiaeast', 'australiasoutheast', 'eastus', 'westeurope', 'southeastasia']
+# os_type -> (connection, port, image)
+OS_TYPES = [
+    ('windows', ('winrm', 5985, 'TEST_WINDOWS_2019_SOE')),
+    ('linux', ('ssh', 22, 'TEST_RHEL_8_SOE')),
+]
+ENVIRONMENTS = ['Non Production', 'Production', 'Test']
+COST_CODES = ['91007200', '91007201', '91007202', '91007203', '91007204', '91007205', '91007206']
+RESOURCE_GROUPS = ['TEST-localhost'] + ['TEST-rg%02d' % n for n in range(1, 11)]
+SIZES = ['Standard_B2ms', 'Standard_D2s_v3', 'Standard_D4s_v3', 'Standard_E4s_v3', 'Standard_F8s_v2',
+         'Standard_B4ms', 'Standard_D8s_v3', 'Standard_E8s_v3', 'Standard_F4s_v2', 'Standard_B1ms',
+         'Standard_D16s_v3', 'Standard_E16s_v3', 'Standard_F16s_v2']
+
+# fields that differ between hosts
+FIELDS = ['ansible_connection', 'ansible_port', 'computer_name', 'default_inventory_hostname', 'id', 'image',
+          'location', 'mac_address', 'name', 'network_interface', 'network_interface_id', 'os_disk', 'os_profile',
+          'os_type', 'private_ip', 'private_ipv4_addresses', 'resource_group', 'tags', 'virtual_machine_size', 'vmid']
+
+
+def _hostname(i):
+    return 'vmware_host%d.local' % (i + 1)
+
+
+def _format(template, fields):
+    '''
+        :return The JSON serialization of template as a %-format string, with a %(field)s
+                placeholder for the serialized value of every field in fields.
+    '''
+
+    marked = dict(template)
+    for field in fields:
+        marked[field] = '\0%s\0' % field
+
+    text = json.dumps(marked).replace('%', '%%')
+    for field in fields:
+        text = text.replace(json.dumps('\0%s\0' % field), '%%(%s)s' % field)
+
+    return text
+
+
+def _group_name(*parts):
+    return re.sub(r'[^A-Za-z0-9_]', '_', '_'.join(parts))
+
+
+def _identity(i):
+    '''
+        :return The name, IP address, MAC address and vmid of host i; host 0 is the template.
+    '''
 
-def _generate_inventory():
-
-    hostvars = {}
-    hostvars['vmware_host1.local'] = {
-        "ansible_connection": "winrm",
-        "ansible_host": "localhost",
-        "ansible_host_ip": "127.0.0.1",
-        "ansible_port": 5985,
-        "availability_zone": None,
-        "computer_name": "localhost",
-        "creation_time": "2000-01-01T00:00:00.6666452+00:00",
-        "data_disks": [],
-        "default_inventory_hostname": "localhost",
-        "id": "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Compute/virtualMachines/localhost",
-        "image": {
-            "id": "/subscriptions/c32bd846-23ea-4b5d-96c6-c5a588a4f127/resourceGroups/RT-US-PRD-ARG-Operations/providers/Microsoft.Compute/galleries/TEST_GALLERY/images/TEST_WINDOWS_2019_SOE"
-        },
-        "location": "australiaeast",
-        "mac_address": [
-            "00-11-48-11-FC-0F"
-        ],
-        "name": "localhost",
-        "network_interface": [
-            "localhost-nic01"
-        ],
-        "network_interface_id": [
-            "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Network/networkInterfaces/localhost-nic01"
-        ],
-        "os_disk": {
-            "id": "/subscriptions/80842efe-e9fd-4ad3-ad2e-9f5aca54bcd4/resourceGroups/TEST-localhost/providers/Microsoft.Compute/disks/localhost-OS-disk",
-            "name": "localhost-OS-disk",
-            "operating_system_type": "windows"
-        },
-        "os_profile": {
-            "system": "windows"
-        },
-        "os_type": "windows",
-        "plan": None,
-        "powerstate": "running",
-        "private_ip": "127.0.0.1",
-        "private_ipv4_addresses": [
-            "127.0.0.1"
-        ],
-        "provisioning_state": "Succeeded",
-        "public_dns_hostnames": [],
-        "public_ip": None,
-        "public_ip_id": None,
-        "public_ip_name": None,
-        "public_ipv4_addresses": [],
-        "resource_group": "TEST-localhost",
-        "resource_type": "Microsoft.Compute/virtualMachines",
-        "security_group": [],
-        "security_group_id": [],
-        "tags": {
-            "CompanyName": "EXAMPLE",
-            "CostCode": "91007200",
-            "CreatedDate": "1/01/2000 00:00:00 PM",
-            "Creator": "Admin",
-            "Environment": "Non Production",
-            "FinanceCode": "A111"
-        },
-        "type": "Microsoft.Compute/virtualMachines",
-        "virtual_machine_size": "Standard_B2ms",
-        "vmid": "50b66256-d378-411f-bf4c-9d5c6276facf",
-        "vmss": {}
-    }
-
-    data = {
-        '_meta': {
-            'hostvars': hostvars
-        },
-        'all': {
-            'children': ['vmware']
-        },
-        'vmware': {
-            'hosts': list(hostvars.keys())
+    if i == 0:
+        return TEMPLATE['name'], TEMPLATE['private_ip'], TEMPLATE['mac_address'][0], TEMPLATE['vmid']
+
+    return ('vm%06d' % i,
+            '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+            '00-11-48-%02X-%02X-%02X' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+            '50b66256-d378-411f-bf4c-%012x' % i)
+
+
+def _hosts(count):
+    '''
+        :return A generator of the (host name, serialized hostvars) of the fleet.
+    '''
+
+    host_format = _format(TEMPLATE, FIELDS)
+
+    # shared nested objects, serialized once
+    os_types = [(json.dumps(os_type), json.dumps(connection), json.dumps(port),
+                 json.dumps({'id': GALLERY + image}), json.dumps({'system': os_type}))
+                for os_type, (connection, port, image) in OS_TYPES]
+    tags = [[json.dumps(dict(TEMPLATE['tags'], Environment=environment, CostCode=cost_code)) for cost_code in COST_CODES]
+            for environment in ENVIRONMENTS]
+    locations = [json.dumps(location) for location in LOCATIONS]
+    sizes = [json.dumps(size) for size in SIZES]
+
+    for i in range(count):
+        name, ip, mac, vmid = _identity(i)
+        resource_group = RESOURCE_GROUPS[i % len(RESOURCE_GROUPS)]
+        os_type, connection, port, image, os_profile = os_types[i % len(os_types)]
+        group_id = '%s/resourceGroups/%s/providers' % (SUBSCRIPTION, resource_group)
+
+        yield _hostname(i), host_format % {
+            'ansible_connection': connection,
+            'ansible_port': port,
+            'computer_name': '"%s"' % name,
+            'default_inventory_hostname': '"%s"' % name,
+            'id': '"%s/Microsoft.Compute/virtualMachines/%s"' % (group_id, name),
+            'image': image,
+            'location': locations[i % len(locations)],
+            'mac_address': '["%s"]' % mac,
+            'name': '"%s"' % name,
+            'network_interface': '["%s-nic01"]' % name,
+            'network_interface_id': '["%s/Microsoft.Network/networkInterfaces/%s-nic01"]' % (group_id, name),
+            'os_disk': '{"id": "%s/Microsoft.Compute/disks/%s-OS-disk", "name": "%s-OS-disk", "operating_system_type": %s}' % (
+                group_id, name, name, os_type),
+            'os_profile': os_profile,
+            'os_type': os_type,
+            'private_ip': '"%s"' % ip,
+            'private_ipv4_addresses': '["%s"]' % ip,
+            'resource_group': '"%s"' % resource_group,
+            'tags': tags[i % len(ENVIRONMENTS)][i % len(COST_CODES)],
+            'virtual_machine_size': sizes[i % len(sizes)],
+            'vmid': '"%s"' % vmid,
         }
-    }
 
-    return json.dumps(data)
+
+def _keyed_groups():
+    '''
+        :return A list of (group name, n, k) for the keyed groups, whose members are every
+                n-th host starting with host k.
+    '''
+
+    groups = [(_group_name('location', location), len(LOCATIONS), k) for k, location in enumerate(LOCATIONS)]
+    groups += [(_group_name('os_type', os_type), len(OS_TYPES), k) for k, (os_type, _) in enumerate(OS_TYPES)]
+    groups += [(_group_name('tag', 'Environment', environment), len(ENVIRONMENTS), k) for k, environment in enumerate(ENVIRONMENTS)]
+    groups += [(_group_name('tag', 'CostCode', cost_code), len(COST_CODES), k) for k, cost_code in enumerate(COST_CODES)]
+    groups += [(_group_name('tag', tag, value), 1, 0) for tag, value in sorted(TEMPLATE['tags'].items())
+               if tag not in ('Environment', 'CostCode')]
+
+    return groups
+
+
+def _write_inventory(writer, args):
+    count = args.count
+
+    writer.hostvars(_hosts(count))
+    writer.group('all', children=['vmware'])
+    writer.group('vmware', hosts=('"%s"' % _hostname(i) for i in range(count)))
+
+    for name, n, k in _keyed_groups():
+        if k < count:
+            writer.group(name, hosts=('"%s"' % _hostname(i) for i in range(k, count, n)))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description='Simulated VMware/Azure fleet.')
+    parser.add_argument('--count', type=int, default=int(os.environ.get('VMWARE_INVENTORY_COUNT', 1)),
+                        help='number of virtual machines')
+    return parser
+
 
 if __name__ == '__main__':
-    print(_generate_inventory())
+    inventory_cli.main(__file__, _write_inventory, _parser())
@@ -1,51 +1,89 @@
 #!/usr/bin/env python
+'''
+Active Directory style Windows inventory whose host names and many hostvars are marked unsafe.
 
+    --count    WINDOWS_INVENTORY_COUNT    number of computers (default 1)
+    --unsafe   WINDOWS_INVENTORY_UNSAFE   fraction of the unsafe-able values that are wrapped
+                                          in {"__ansible_unsafe": ...} (default 1.0)
+
+The first host is the original hand-written computer. The wrapped values are spread evenly
+over the hosts, so --unsafe 0 produces the same inventory without a single wrapper; see
+tools/unsafe_inventory_bench.py.
+'''
+
+import argparse
 import json
+import os
+
+import inventory_cli
+
+# hostvars that can be marked unsafe, in the order the fraction is applied to them
+UNSAFE_FIELDS = ['computer_guid', 'computer_name', 'computer_sid', 'os_name', 'os_version']
+
 
-def _generate_inventory():
-    data = {
-        "_meta": {
-            "hostvars": {
-                "desktop-hitmebabyonemoretime": {
-                    "ansible_host": "DESKTOP-HITMEBABYONEMORETIME.example.org",
-                    "computer_guid": {
-                        "__ansible_unsafe": "7c1ba40a-5885-40c0-8d24-c1c7b3ab990c"
-                    },
-                    "computer_lastseen_at": "2010-01-01T00:00:00.000000+0000",
-                    "computer_membership": [],
-                    "computer_name": {
-                        "__ansible_unsafe": "DESKTOP-HITMEBABYONEMORETIME"
-                    },
-                    "computer_sid": {
-                        "__ansible_unsafe": "S-2-3-4-*****"
-                    },
-                    "microsoft_ad_distinguished_name": "CN=DESKTOP-HITMEBABYONEMORETIME,OU=Computers,OU=Eng,DC=example,DC=org",
-                    "os_name": {
-                        "__ansible_unsafe": "Windows 10 Enterprise"
-                    },
-                    "os_version": {
-                        "__ansible_unsafe": "10.0 (17134)"
-                    }
-                }
-            }
-        },
-        "all": {
-            "children": [
-                "ungrouped",
-                "windows"
-            ]
-        },
-        "windows": {
-            "hosts": [
-                {
-                    "__ansible_unsafe": "desktop-hitmebabyonemoretime"
-                }
-            ]
-        }
+def _computer(i):
+    '''
+        :return The name and the hostvars of computer i, without unsafe wrappers.
+    '''
+
+    if i == 0:
+        name, guid, sid = 'DESKTOP-HITMEBABYONEMORETIME', '7c1ba40a-5885-40c0-8d24-c1c7b3ab990c', 'S-2-3-4-*****'
+    else:
+        name, guid, sid = 'DESKTOP-%06d' % i, '7c1ba40a-5885-40c0-8d24-%012x' % i, 'S-2-3-4-%d' % i
+
+    return name.lower(), {
+        "ansible_host": "%s.example.org" % name,
+        "computer_guid": guid,
+        "computer_lastseen_at": "2010-01-01T00:00:00.000000+0000",
+        "computer_membership": [],
+        "computer_name": name,
+        "computer_sid": sid,
+        "microsoft_ad_distinguished_name": "CN=%s,OU=Computers,OU=Eng,DC=example,DC=org" % name,
+        "os_name": "Windows 10 Enterprise",
+        "os_version": "10.0 (17134)"
     }
 
 
-    return json.dumps(data)
+class Wrapper:
+    '''
+        Decides which values are wrapped, so that a fraction of all values is.
+    '''
+
+    def __init__(self, fraction):
+        self.fraction = min(1.0, max(0.0, fraction))
+        self.values = 0
+
+    def __call__(self, value):
+        wrap = int((self.values + 1) * self.fraction) != int(self.values * self.fraction)
+        self.values += 1
+        return {'__ansible_unsafe': value} if wrap else value
+
+
+def _hosts(count, wrap):
+    for i in range(count):
+        name, hostvars = _computer(i)
+        for field in UNSAFE_FIELDS:
+            hostvars[field] = wrap(hostvars[field])
+        yield name, json.dumps(hostvars)
+
+
+def _write_inventory(writer, args):
+    # host names and hostvars are wrapped by separate wrappers, so both get the same fraction
+    writer.hostvars(_hosts(args.count, Wrapper(args.unsafe)))
+    writer.group('all', children=['ungrouped', 'windows'])
+
+    wrap = Wrapper(args.unsafe)
+    writer.group('windows', hosts=(json.dumps(wrap(_computer(i)[0])) for i in range(args.count)))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description='Active Directory style Windows inventory.')
+    parser.add_argument('--count', type=int, default=int(os.environ.get('WINDOWS_INVENTORY_COUNT', 1)),
+                        help='number of computers')
+    parser.add_argument('--unsafe', type=float, default=float(os.environ.get('WINDOWS_INVENTORY_UNSAFE', 1.0)),
+                        help='fraction of the values marked unsafe, from 0 to 1')
+    return parser
+
 
 if __name__ == '__main__':
-    print(_generate_inventory())
+    inventory_cli.main(__file__, _write_inventory, _parser())
@@ -0,0 +1,319 @@
+'''
+Command line handling shared by the dynamic inventory scripts.
+
+A script describes its inventory with an InventoryWriter and hands it to main(), which answers
+the standard inventory script arguments:
+
+    --list          print the whole inventory (the default)
+    --host <name>   print the hostvars of one host
+
+The first run of a script with a given set of parameters writes the document and an index of
+its hosts to a cache directory. Later runs stream the cached document for --list and read a
+single host entry from it for --host, without generating the inventory again. The cache is
+keyed by a hash of the parameters and the modification times of the script and this module;
+a new version of either removes the caches of the old one.
+
+    INVENTORY_CACHE_DIR   cache directory (default: $XDG_CACHE_HOME/ansible-inventory, or
+                          ~/.cache/ansible-inventory); it must be owned by the user and must not
+                          be writable by anyone else
+    INVENTORY_CACHE       set to 0 to generate the inventory on every run
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+from array import array
+
+# host entries written per chunk
+CHUNK = 10000
+
+DOCUMENT = 'inventory.json'
+INDEX = 'hosts.idx'
+
+INDEX_HEADER = struct.Struct('<8sQ')
+INDEX_MAGIC = b'INVIDX1\0'
+# crc32 of the host name, offset + 1 of the host entry in the document (0 for an empty slot), entry length
+INDEX_SLOT = struct.Struct('<IQQ')
+
+
+class InventoryWriter:
+    '''
+        Writes an inventory document in the --list format as it is generated and records where
+        the entry of every host starts, so that its hostvars can be read back from the document.
+    '''
+
+    def __init__(self, out, index=True):
+        '''
+            :param out: Binary file the document is written to.
+            :param index: Record the position of every host entry for write_index().
+        '''
+
+        self.out = out
+        self.index = index
+        self.position = 0
+        self._separator = '{'
+        self._hashes = array('L')
+        self._offsets = array('Q')
+        self._lengths = array('Q')
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def _array(self, items):
+        '''
+            :param items: Iterable of values serialized as JSON.
+        '''
+
+        items = iter(items)
+        separator = b'['
+        while True:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == CHUNK:
+                    break
+            if not chunk:
+                break
+            self._write(separator + ', '.join(chunk).encode('utf-8'))
+            separator = b', '
+        self._write(b'[]' if separator == b'[' else b']')
+
+    def hostvars(self, hosts):
+        '''
+            Write the _meta hostvars; must be called before any group.
+            :param hosts: Iterable of (host name, hostvars serialized as JSON) tuples.
+        '''
+
+        self._write(b'{"_meta": {"hostvars": {')
+        self._separator = ', '
+
+        chunk = []
+        size = 0
+        separator = b''
+        for name, variables in hosts:
+            entry = (json.dumps(name) + ': ' + variables).encode('utf-8')
+
+            if self.index:
+                self._hashes.append(zlib.crc32(name.encode('utf-8')))
+                self._offsets.append(self.position + size + len(separator))
+                self._lengths.append(len(entry))
+
+            entry = separator + entry
+            separator = b', '
+            chunk.append(entry)
+            size += len(entry)
+
+            if len(chunk) == CHUNK:
+                self._write(b''.join(chunk))
+                chunk = []
+                size = 0
+
+        self._write(b''.join(chunk) + b'}}')
+
+    def group(self, name, hosts=None, children=None, variables=None):
+        '''
+            :param name: Name of the group.
+            :param hosts: Iterable of the host names of the group, serialized as JSON.
+            :param children: List of the names of the child groups.
+            :param variables: Dictionary of the group variables.
+        '''
+
+        self._write(('%s%s: {' % (self._separator, json.dumps(name))).encode('utf-8'))
+        self._separator = ', '
+
+        separator = ''
+        if hosts is not None:
+            self._write(b'"hosts": ')
+            self._array(hosts)
+            separator = ', '
+        if variables is not None:
+            self._write(('%s"vars": %s' % (separator, json.dumps(variables))).encode('utf-8'))
+            separator = ', '
+        if children is not None:
+            self._write(('%s"children": %s' % (separator, json.dumps(children))).encode('utf-8'))
+
+        self._write(b'}')
+
+    def close(self):
+        self._write(b'{}\n' if self._separator == '{' else b'}\n')
+
+    def write_index(self, out):
+        '''
+            Write an open addressing hash table of the host entries, at most half full.
+            :param out: Binary file the index is written to.
+        '''
+
+        slots = 2
+        while slots < 2 * len(self._offsets):
+            slots *= 2
+        mask = slots - 1
+
+        table = bytearray(INDEX_SLOT.size * slots)
+        for name_hash, offset, length in zip(self._hashes, self._offsets, self._lengths):
+            slot = name_hash & mask
+            while INDEX_SLOT.unpack_from(table, slot * INDEX_SLOT.size)[1]:
+                slot = (slot + 1) & mask
+            INDEX_SLOT.pack_into(table, slot * INDEX_SLOT.size, name_hash, offset + 1, length)
+
+        out.write(INDEX_HEADER.pack(INDEX_MAGIC, slots))
+        out.write(table)
+
+
+def read_host(directory, name):
+    '''
+        :param directory: Directory holding a document and its index.
+        :param name: Name of the host.
+        :return The hostvars of the host serialized as JSON, or None for an unknown host.
+    '''
+
+    key = (json.dumps(name) + ': ').encode('utf-8')
+    name_hash = zlib.crc32(name.encode('utf-8'))
+
+    with open(os.path.join(directory, INDEX), 'rb') as index, open(os.path.join(directory, DOCUMENT), 'rb') as document:
+        magic, slots = INDEX_HEADER.unpack(index.read(INDEX_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError('%s is not an inventory index' % index.name)
+
+        slot = name_hash & (slots - 1)
+        while True:
+            index.seek(INDEX_HEADER.size + slot * INDEX_SLOT.size)
+            slot_hash, offset, length = INDEX_SLOT.unpack(index.read(INDEX_SLOT.size))
+            if not offset:
+                return None
+
+            if slot_hash == name_hash:
+                # different names can share a hash, the entry itself tells them apart
+                document.seek(offset - 1)
+                entry = document.read(length)
+                if entry.startswith(key):
+                    return entry[len(key):]
+
+            slot = (slot + 1) & (slots - 1)
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _cache_directory(script, params):
+    '''
+        :return The cache root, the name prefix of the caches of the script's current version,
+                and the cache directory of the script and its parameters.
+    '''
+
+    root = os.environ.get('INVENTORY_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'ansible-inventory')
+
+    script = os.path.realpath(script)
+    stem = '%s-%s' % (os.path.splitext(os.path.basename(script))[0], _digest(script)[:8])
+    # a new version of the script or of this module invalidates the cache
+    version = '%s-%s' % (stem, _digest([os.stat(script).st_mtime_ns, os.stat(__file__).st_mtime_ns])[:8])
+
+    return root, version, os.path.join(root, '%s-%s' % (version, _digest(params)[:16]))
+
+
+def _check_root(root):
+    '''
+        Refuse a cache root that another user could have planted an inventory in.
+    '''
+
+    st = os.stat(root)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise SystemExit('inventory cache directory %s must be owned by uid %d and not writable by others; '
+                         'set INVENTORY_CACHE_DIR or INVENTORY_CACHE=0' % (root, os.getuid()))
+
+
+def _build(write, args, directory):
+    '''
+        Write the document and index of the inventory to directory.
+    '''
+
+    with open(os.path.join(directory, DOCUMENT), 'wb') as out:
+        writer = InventoryWriter(out)
+        write(writer, args)
+        writer.close()
+
+    with open(os.path.join(directory, INDEX), 'wb') as out:
+        writer.write_index(out)
+
+
+def _cached(write, args, script, params):
+    '''
+        :return The cache directory of the inventory, built if it does not exist yet.
+    '''
+
+    root, version, directory = _cache_directory(script, params)
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    _check_root(root)
+
+    if os.path.isdir(directory):
+        return directory
+
+    building = tempfile.mkdtemp(prefix='.%s-' % version, dir=root)
+
+    try:
+        _build(write, args, building)
+        # the cache appears complete or not at all; a concurrent run may have built it first
+        os.rename(building, directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+
+    # drop the caches of previous versions of the script; other parameters may still be in use
+    stem = version.rsplit('-', 1)[0]
+    for entry in os.listdir(root):
+        if entry.startswith(stem + '-') and not entry.startswith(version + '-'):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+    return directory
+
+
+def main(script, write, parser=None, argv=None):
+    '''
+        Answer --list or --host for an inventory script.
+        :param script: Path of the inventory script, usually __file__.
+        :param write: Function called with an InventoryWriter and the parsed arguments, which writes the inventory.
+        :param parser: ArgumentParser with the options of the script; their values are part of the cache key.
+    '''
+
+    parser = parser or argparse.ArgumentParser()
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--list', action='store_true', help='print the whole inventory (default)')
+    mode.add_argument('--host', help='print the hostvars of a host')
+    args = parser.parse_args(argv)
+
+    params = dict((name, value) for name, value in vars(args).items() if name not in ('list', 'host'))
+    out = sys.stdout.buffer
+
+    if os.environ.get('INVENTORY_CACHE', '1').lower() in ('0', 'false', 'no', 'off'):
+        if args.host is None:
+            writer = InventoryWriter(out, index=False)
+            write(writer, args)
+            writer.close()
+            return
+
+        directory = tempfile.mkdtemp()
+        try:
+            _build(write, args, directory)
+            hostvars = read_host(directory, args.host)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    else:
+        directory = _cached(write, args, script, params)
+        if args.host is None:
+            with open(os.path.join(directory, DOCUMENT), 'rb') as document:
+                shutil.copyfileobj(document, out, 1 << 20)
+            return
+        hostvars = read_host(directory, args.host)
+
+    out.write((hostvars or b'{}') + b'\n')
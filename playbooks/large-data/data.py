@@ -1,21 +1,85 @@
 #!/usr/bin/env python
+'''
+Print a JSON array of Active Directory user objects for the large-data playbook.
 
-import json
-
-example_obj = {
-    "DistinguishedName": "CN=First Name Last Name,OU=Standard,OU=Allusers,DC=corp,DC=example,DC=com",
-    "Name": "First Name Last Name",
-    "ObjectClass": "user",
-    "ObjectGUID": "3e1038fb-14be-48f1-9d94-def71cd2104d",
-    "l": "User City",
-    "memberOf": [
-        "CN=AP_AD_Group_1,OU=Groups,DC=corp,DC=example,DC=com",
-        "CN=AP_AD_Group_2,OU=Groups,DC=corp,DC=example,DC=com",
-        "CN=AP_AD_Group_3,OU=Groups,DC=corp,DC=example,DC=com"
-    ],
-    "userPrincipalName": "username@example.com"
-}
-
-count = 8000
-
-print(json.dumps([example_obj for x in range(count)]))
\ No newline at end of file
+    data.py [--count 8000] [--seed 0] [--size 3]
+
+Every user gets its own name, GUID, city, user principal name and between 1 and --size group
+memberships, drawn from a random generator seeded with --seed. The array is written in chunks
+as it is generated, so memory stays constant for any --count.
+'''
+
+import argparse
+import math
+import random
+import sys
+
+FIRST_NAMES = ['Alex', 'Chris', 'Dana', 'Jamie', 'Jordan', 'Kim', 'Lee', 'Morgan', 'Pat', 'Robin', 'Sam', 'Taylor']
+LAST_NAMES = ['Brown', 'Chen', 'Garcia', 'Jones', 'Kowalski', 'Martin', 'Nguyen', 'Patel', 'Rossi', 'Smith', 'Weber']
+CITIES = ['Amsterdam', 'Austin', 'Brisbane', 'Chicago', 'Melbourne', 'Munich', 'Perth', 'Singapore', 'Sydney', 'Toronto']
+
+GROUPS = 1000
+
+USER = ('{"DistinguishedName": "CN=%(name)s,OU=Standard,OU=Allusers,DC=corp,DC=example,DC=com", "Name": "%(name)s", '
+        '"ObjectClass": "user", "ObjectGUID": "%(guid)s", "l": "%(city)s", "memberOf": [%(groups)s], '
+        '"userPrincipalName": "%(upn)s@example.com"}')
+
+# users serialized per write
+CHUNK = 1000
+
+
+def _users(count, seed, size):
+    '''
+        :return A generator of the users serialized as JSON.
+    '''
+
+    rng = random.Random(seed)
+    uniform = rng.random
+    groups = ['"CN=AP_AD_Group_%d,OU=Groups,DC=corp,DC=example,DC=com"' % n for n in range(1, GROUPS + 1)]
+    # a stride coprime with GROUPS visits distinct groups
+    strides = [stride for stride in range(1, GROUPS) if math.gcd(stride, GROUPS) == 1]
+
+    for i in range(count):
+        first = FIRST_NAMES[int(uniform() * len(FIRST_NAMES))]
+        last = LAST_NAMES[int(uniform() * len(LAST_NAMES))]
+
+        start = int(uniform() * GROUPS)
+        stride = strides[int(uniform() * len(strides))]
+        member_of = [groups[(start + n * stride) % GROUPS] for n in range(1 + int(uniform() * size))] if size else []
+
+        # random version 4 UUID
+        guid = '%032x' % rng.getrandbits(128)
+
+        yield USER % {
+            'name': '%s %s %d' % (first, last, i),
+            'guid': '%s-%s-4%s-%x%s-%s' % (guid[:8], guid[8:12], guid[13:16], 8 | int(guid[16], 16) & 3, guid[17:20], guid[20:]),
+            'city': CITIES[int(uniform() * len(CITIES))],
+            'groups': ', '.join(member_of),
+            'upn': '%s.%s.%d' % (first.lower(), last.lower(), i),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print a JSON array of Active Directory users.')
+    parser.add_argument('--count', type=int, default=8000, help='number of users (default: 8000)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator (default: 0)')
+    parser.add_argument('--size', type=int, default=3, help='maximum number of groups per user (default: 3)')
+    args = parser.parse_args(argv)
+
+    if not 0 <= args.size <= GROUPS:
+        parser.error('--size must be between 0 and %d' % GROUPS)
+
+    out = sys.stdout
+    users = _users(args.count, args.seed, args.size)
+    separator = '['
+    while True:
+        chunk = [user for _, user in zip(range(CHUNK), users)]
+        if not chunk:
+            break
+        out.write(separator + ', '.join(chunk))
+        separator = ', '
+    out.write('[]\n' if separator == '[' else ']\n')
+
+
+if __name__ == '__main__':
+    main()
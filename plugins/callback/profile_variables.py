@@ -17,6 +17,7 @@ options:
   record_hosts:
     description:
       - Capture variable data from a host or set of hosts. Values must match the hosts' `inventory_hostname`.
+      - Values starting with `~` are regular expressions that must match the whole `inventory_hostname`; values starting with `%` are glob patterns, e.g. `%web*`.
       - Provide either a string with entries separated by a semicolon (:) to specify multiple strings or provide a list.
       - The variable `profile_variables_record_hosts` must be used as an extra variable via the `-e` flag; can also use `-e @vars.yml` to include variables from a file.
     default: ""
@@ -31,6 +32,7 @@ options:
   record_tasks:
     description:
       - Capture variable data from a task or set of tasks. Values must be within the task name.
+      - Values starting with `~` are regular expressions searched for in the task name; values starting with `%` are glob patterns matched against the whole task name, e.g. `%Install *`.
       - Provide either a string with entries separated by a semicolon (:) to specify multiple strings or provide a list.
       - The variable `profile_variables_record_tasks` must be used as an extra variable via the `-e` flag; can also use `-e @vars.yml` to include variables from a file.
     default: ""
@@ -56,6 +58,201 @@ options:
         key: record_vars
     vars:
       - name: profile_variables_record_vars
+  record_on:
+    description:
+      - When entries are recorded for a matching host and task.
+      - C(start) records the variables a task starts with, from O(v2_runner_on_start).
+      - C(ok) records the variables after a task succeeds, from O(v2_runner_on_ok), including the facts and registered values the task just set.
+        Like C(start) entries, they are served from the host's variable snapshot rather than resolving the host's variables again.
+      - C(both) records both, so the change a task makes can be read from consecutive entries.
+      - Every entry carries an C(event) key of C(start) or C(ok).
+    default: start
+    type: string
+    choices: ['start', 'ok', 'both']
+    env:
+      - name: PROFILE_VARIABLES_RECORD_ON
+    ini:
+      - section: callback_profile_variables
+        key: record_on
+  record_mode:
+    description:
+      - What each recorded entry contains.
+      - C(full) records the complete task arguments, task variables and tracked variables for every entry.
+      - C(delta) records them as JSON-patch style operations against the previous entry for the same host, so unchanged values are not repeated.
+        Use C(tools/profile_variables_reader.py) to rebuild the full timeline from delta output.
+    default: full
+    type: string
+    choices: ['full', 'delta']
+    env:
+      - name: PROFILE_VARIABLES_RECORD_MODE
+    ini:
+      - section: callback_profile_variables
+        key: record_mode
+  output_thread:
+    description:
+      - Serialize and write entries on a background thread instead of the strategy's main thread, so result processing
+        never waits on JSON encoding, delta hashing or file I/O.
+      - Entries are handed over through a queue of O(output_queue_size) entries; when it is full, recording waits for the writer.
+    default: false
+    type: bool
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_THREAD
+    ini:
+      - section: callback_profile_variables
+        key: output_thread
+  output_queue_size:
+    description:
+      - Number of entries that may wait for the background writer enabled with O(output_thread).
+    default: 1000
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_QUEUE_SIZE
+    ini:
+      - section: callback_profile_variables
+        key: output_queue_size
+  sample_mode:
+    description:
+      - How hosts are sampled when O(record_hosts) is empty, instead of recording every host.
+      - C(none) records every host.
+      - C(per_group) records up to O(sample_size) hosts from each inventory group in the play.
+      - C(percent) records a deterministic, hash-based O(sample_percent) of hosts. It needs no inventory walk and suits the largest inventories.
+      - C(reservoir) records a uniform random sample of O(sample_size) hosts from the play, drawn with O(sample_seed).
+    default: none
+    type: string
+    choices: ['none', 'per_group', 'percent', 'reservoir']
+    env:
+      - name: PROFILE_VARIABLES_SAMPLE_MODE
+    ini:
+      - section: callback_profile_variables
+        key: sample_mode
+  sample_size:
+    description:
+      - Number of hosts per group (C(per_group)) or in total (C(reservoir)) to record.
+    default: 10
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_SAMPLE_SIZE
+    ini:
+      - section: callback_profile_variables
+        key: sample_size
+  sample_percent:
+    description:
+      - Percentage of hosts the C(percent) sample mode records.
+    default: 1.0
+    type: float
+    env:
+      - name: PROFILE_VARIABLES_SAMPLE_PERCENT
+    ini:
+      - section: callback_profile_variables
+        key: sample_percent
+  sample_seed:
+    description:
+      - Seed for the sample modes. The same seed and inventory always select the same hosts.
+    default: 0
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_SAMPLE_SEED
+    ini:
+      - section: callback_profile_variables
+        key: sample_seed
+  max_records:
+    description:
+      - Maximum number of entries the C(summary) output mode keeps in memory. Further entries are spilled to a temporary file
+        in O(spill_dir) and read back when the summary is displayed. C(0) keeps everything in memory.
+    default: 0
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_MAX_RECORDS
+    ini:
+      - section: callback_profile_variables
+        key: max_records
+  spill_dir:
+    description:
+      - Directory for the file entries are spilled to once O(max_records) is reached. Defaults to the system temporary directory.
+    type: path
+    env:
+      - name: PROFILE_VARIABLES_SPILL_DIR
+    ini:
+      - section: callback_profile_variables
+        key: spill_dir
+  profile_timing:
+    description:
+      - Measure how long tasks and the callback itself take and display a percentile summary at the end of the playbook.
+      - Reports the wall-clock time of every task on every host, the latency between a task starting and each host's runner
+        starting, and the time the callback spends recording entries and resolving variables.
+    default: false
+    type: bool
+    env:
+      - name: PROFILE_VARIABLES_PROFILE_TIMING
+    ini:
+      - section: callback_profile_variables
+        key: profile_timing
+  output_mode:
+    description:
+      - How recorded entries are written.
+      - C(summary) keeps every entry in memory and displays them as one pretty-printed JSON document at the end of the playbook.
+      - C(stream) writes each entry as one JSON line (NDJSON) to O(output_path) or O(output_fd) as it is captured, so memory stays flat on long runs.
+    default: summary
+    type: string
+    choices: ['summary', 'stream']
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_MODE
+    ini:
+      - section: callback_profile_variables
+        key: output_mode
+  output_path:
+    description:
+      - File the C(stream) output mode writes to. The file is truncated when the playbook starts.
+    type: path
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_PATH
+    ini:
+      - section: callback_profile_variables
+        key: output_path
+  output_fd:
+    description:
+      - Already open file descriptor the C(stream) output mode writes to when O(output_path) is not set.
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_FD
+    ini:
+      - section: callback_profile_variables
+        key: output_fd
+  output_format:
+    description:
+      - Encoding of the entries written by the C(stream) output mode.
+      - C(json) writes one JSON document per line (NDJSON).
+      - C(cbor) writes length-prefixed CBOR records with host, task and event names interned, which is several times
+        smaller than JSON for large fact trees. Read it with C(tools/profile_variables_reader.py).
+    default: json
+    type: string
+    choices: ['json', 'cbor']
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_FORMAT
+    ini:
+      - section: callback_profile_variables
+        key: output_format
+  output_compression:
+    description:
+      - Compression applied to the C(stream) output. C(zstd) requires the C(zstandard) Python library on the controller.
+    default: none
+    type: string
+    choices: ['none', 'gzip', 'zstd']
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_COMPRESSION
+    ini:
+      - section: callback_profile_variables
+        key: output_compression
+  output_flush_records:
+    description:
+      - Number of entries the C(stream) output mode buffers before writing and flushing them.
+    default: 100
+    type: integer
+    env:
+      - name: PROFILE_VARIABLES_OUTPUT_FLUSH_RECORDS
+    ini:
+      - section: callback_profile_variables
+        key: output_flush_records
 '''
 
 EXAMPLES = '''
@@ -69,6 +266,10 @@ ENABLE: >
     # record_hosts = ""
     # record_tasks = ""
     # record_vars  = ""
+    # record_on    = start
+    # record_mode  = full
+    # output_mode  = summary
+    # output_path  = ""
 
   Another option is to use the environment variable ANSIBLE_CALLBACK_PLUGINS
 
@@ -100,6 +301,34 @@ SAMPLE_COMMANDS: >
     PROFILE_VARIABLES_RECORD_HOSTS="localhost" PROFILE_VARIABLES_RECORD_TASKS="debug" ansible-playbook -i inventory playbook.yml
 
 
+    # Patterns: every host in the web group's naming scheme, and any task whose name starts with "Configure"
+
+    ansible-playbook -i inventory -e "profile_variables_record_hosts='web-*'" -e "profile_variables_record_tasks='~^Configure'" playbook.yml
+
+
+    # Record a deterministic 2% of a large inventory, keeping at most 10000 entries in memory
+
+    PROFILE_VARIABLES_SAMPLE_MODE=percent PROFILE_VARIABLES_SAMPLE_PERCENT=2 PROFILE_VARIABLES_MAX_RECORDS=10000 ansible-playbook -i inventory playbook.yml
+
+
+    # Summarize task durations and the callback's own overhead at the end of the run
+
+    PROFILE_VARIABLES_PROFILE_TIMING=true ansible-playbook -i inventory playbook.yml
+
+
+    # Stream entries to a JSON lines file as they are captured instead of printing them at the end
+
+    PROFILE_VARIABLES_OUTPUT_MODE=stream PROFILE_VARIABLES_OUTPUT_PATH=/tmp/profile.ndjson ansible-playbook -i inventory playbook.yml
+
+
+    # Stream compact, compressed binary entries and query them afterwards
+
+    PROFILE_VARIABLES_OUTPUT_MODE=stream PROFILE_VARIABLES_OUTPUT_FORMAT=cbor PROFILE_VARIABLES_OUTPUT_COMPRESSION=gzip \\
+      PROFILE_VARIABLES_OUTPUT_PATH=/tmp/profile.cbor.gz ansible-playbook -i inventory playbook.yml
+
+    tools/profile_variables_reader.py --host hosta --var var_on_play /tmp/profile.cbor.gz
+
+
 SAMPLE_OUTPUT: >
 
   # PLAY [all] **************************************************************************************************************************
@@ -178,6 +407,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "Debug 1",
+  #         "event": "start",
   #         "task_arguments": {
   #             "msg": "{{ var_on_play }}"
   #         },
@@ -191,6 +421,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "Instantiate another value",
+  #         "event": "start",
   #         "task_arguments": {
   #             "var_set_during_play": "hello set_fact"
   #         },
@@ -204,6 +435,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "Debug 2",
+  #         "event": "start",
   #         "task_arguments": {
   #             "var": "{{ item }}"
   #         },
@@ -217,6 +449,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "Include Role",
+  #         "event": "start",
   #         "task_arguments": {
   #             "name": "OneDebugRole"
   #         },
@@ -231,6 +464,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "OneDebugRole : Debug In Role",
+  #         "event": "start",
   #         "task_arguments": {
   #             "msg": "{{ message }}"
   #         },
@@ -245,6 +479,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "Trigger Handler",
+  #         "event": "start",
   #         "task_arguments": {
   #             "msg": "Triggering Handler"
   #         },
@@ -258,6 +493,7 @@ SAMPLE_OUTPUT: >
   #     {
   #         "host": "hosta",
   #         "task": "handleit",
+  #         "event": "start",
   #         "task_arguments": {
   #             "msg": "{{ message }}"
   #         },
@@ -271,10 +507,823 @@ SAMPLE_OUTPUT: >
   # ]
 '''
 
+import fnmatch
+import gzip
+import hashlib
 import json
+import math
+import os
+import queue
+import random
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
 
+from ansible import constants as C
+from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.callback import CallbackBase
 
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+
+UNDEFINED = 'VARIABLE IS UNDEFINED'
+
+# Start of the decompressed content of files written with output_format = cbor
+CBOR_MAGIC = b'PVAR\x01'
+
+
+class Histogram:
+    '''
+        Log-bucketed histogram of durations in seconds.
+
+        Memory is bounded by the number of buckets rather than the number of samples, and
+        percentiles are estimated to within one bucket (about 9%).
+    '''
+
+    BASE = 2 ** (1 / 8)
+    SMALLEST = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = int(math.log(max(value, self.SMALLEST) / self.SMALLEST, self.BASE))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+
+        wanted = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= wanted:
+                return min(self.SMALLEST * self.BASE ** (index + 1), self.max)
+        return self.max
+
+    def decades(self):
+        '''
+            :return A list of (upper bound in seconds, count) pairs, one per power of ten.
+        '''
+        decades = {}
+        for index, count in self.buckets.items():
+            upper = 10 ** math.ceil(math.log10(self.SMALLEST * self.BASE ** (index + 1)))
+            decades[upper] = decades.get(upper, 0) + count
+        return sorted(decades.items())
+
+
+class TimingProfile:
+    '''
+        Collects task and callback timings for the summary displayed at the end of the playbook.
+    '''
+
+    def __init__(self):
+        # task uuid -> (task name, Histogram of per-host durations), in the order tasks started
+        self.tasks = {}
+        self.queue_latency = Histogram()
+        self.recording = Histogram()
+        self.resolving = Histogram()
+
+        self._task_started = {}
+        self._runner_started = {}
+
+    def task_start(self, task):
+        self._task_started[task._uuid] = time.perf_counter()
+        self.tasks.setdefault(task._uuid, (task.get_name(), Histogram()))
+
+    def runner_start(self, host, task):
+        now = time.perf_counter()
+        self._runner_started[(host.get_name(), task._uuid)] = now
+
+        task_started = self._task_started.get(task._uuid)
+        if task_started is not None:
+            self.queue_latency.add(now - task_started)
+
+    def runner_end(self, result):
+        started = self._runner_started.pop((result._host.get_name(), result._task._uuid), None)
+        if started is None:
+            return
+
+        _, durations = self.tasks.setdefault(result._task._uuid, (result._task.get_name(), Histogram()))
+        durations.add(time.perf_counter() - started)
+
+    def summary(self):
+        '''
+            :return The lines of the timing summary.
+        '''
+        def row(name, histogram):
+            return (
+                f"{name[:48]:<48} {histogram.count:>7} {histogram.percentile(50):>9.4f} {histogram.percentile(90):>9.4f}"
+                f" {histogram.percentile(99):>9.4f} {histogram.max:>9.4f} {histogram.total:>10.3f}"
+            )
+
+        lines = [f"{'TIMING (seconds)':<48} {'count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'total':>10}"]
+
+        overall = Histogram()
+        for name, durations in self.tasks.values():
+            lines.append(row(name, durations))
+            for index, count in durations.buckets.items():
+                overall.buckets[index] = overall.buckets.get(index, 0) + count
+            overall.count += durations.count
+            overall.total += durations.total
+            overall.max = max(overall.max, durations.max)
+
+        lines.append(row('[all tasks]', overall))
+        lines.append(row('[queue to runner start]', self.queue_latency))
+        lines.append(row('[callback: record]', self.recording))
+        lines.append(row('[callback: variable resolution]', self.resolving))
+
+        lines.append('')
+        lines.append('Task duration histogram (per host):')
+        for upper, count in overall.decades():
+            lines.append(f"  <= {upper:<8g} {count:>7}")
+
+        return lines
+
+
+class VariableSnapshots:
+    '''
+        View of the tracked variables for the current play.
+
+        What a task sees below its own vars is resolved through the variable manager once per
+        host and context: the task's role and dependency chain, its search path, and the play
+        roles visible to the host. The layers above are cheap to read and are applied on every
+        record in the variable manager's order: task and block vars, include_vars, set_fact and
+        register, include params and extra vars.
+
+        Results that change the lower layers (gathered facts, group_by and add_host) drop the
+        snapshots of the hosts they apply to. meta: clear_facts and refresh_inventory are not
+        tracked.
+    '''
+
+    def __init__(self, play, names, timer=None):
+        self.play = play
+        self.names = list(dict.fromkeys(names))
+        self.variable_manager = play.get_variable_manager()
+        self.extra_vars = self.variable_manager.extra_vars
+
+        # Optional Histogram that receives the time spent resolving each record
+        self.timer = timer
+
+        # hostname -> context -> {variable name: raw value}
+        self._values = {}
+        # task context -> vars-free copy of a task in that context
+        self._stand_ins = {}
+        # hostname -> (hostvars of the host, {variable name: templated value})
+        self._fallbacks = {}
+        self._hostvars = None
+
+    def get(self, host, task, task_vars):
+        '''
+            :param host: The host being recorded.
+            :param task: The task being recorded.
+            :param task_vars: The task's own variables (task.get_vars()).
+            :return A dictionary of the tracked variables as the task sees them.
+        '''
+        started = time.perf_counter()
+        hostname = host.get_name()
+        task_context = self._task_context(task)
+        context = (task_context, self._play_roles(hostname))
+
+        contexts = self._values.setdefault(hostname, {})
+        values = contexts.get(context)
+        if values is None:
+            values = contexts[context] = self._resolve(host, task, task_context)
+
+        # the variable manager's caches are read directly, so they are always current
+        layers = (
+            task_vars,
+            self.variable_manager._vars_cache.get(hostname, {}),
+            self.variable_manager._nonpersistent_fact_cache.get(hostname, {}),
+            task.get_include_params(),
+            self.extra_vars,
+        )
+
+        retvars = {}
+        for name in self.names:
+            value = values[name]
+            for layer in layers:
+                if name in layer:
+                    value = layer[name]
+            retvars[name] = value or self._fallback(hostname, name) or UNDEFINED
+
+        # the hostvars fallback is timed too, it templates from every layer
+        if self.timer is not None:
+            self.timer.add(time.perf_counter() - started)
+
+        return retvars
+
+    def update(self, result):
+        '''
+            Drop the snapshots a task result makes stale.
+            :param result: The TaskResult handed to the v2_runner_on_* callbacks.
+        '''
+        task = result._task
+        items = [res for res in [result._result, *result._result.get('results', [])] if isinstance(res, dict)]
+
+        facts = any('ansible_facts' in res for res in items)
+        inventory = any('add_host' in res or 'add_group' in res for res in items)
+        if not (facts or inventory or task.register):
+            return
+
+        # set_fact and include_vars land above the task vars and are read on every record;
+        # other facts go to the fact cache, below the play vars
+        lower = inventory or facts and (
+            task.action not in C._ACTION_SET_FACT + C._ACTION_INCLUDE_VARS
+            or task.action in C._ACTION_SET_FACT and boolean(task.args.get('cacheable', False), strict=False)
+        )
+
+        if task.run_once:
+            hostnames = list(self._fallbacks) + list(self._values)
+        else:
+            hostnames = [result._host.get_name()]
+            for res in items:
+                if task.delegate_to is not None:
+                    # facts from delegated tasks are set on the delegated host
+                    hostnames.append(res.get('_ansible_delegated_vars', {}).get('ansible_delegated_host') or task.delegate_to)
+                if isinstance(res.get('add_host'), dict):
+                    hostnames.append(res['add_host'].get('host_name'))
+
+        for hostname in hostnames:
+            # the fallback values are templated from every layer
+            self._fallbacks.pop(hostname, None)
+            if lower:
+                self._values.pop(hostname, None)
+
+    def _task_context(self, task):
+        '''
+            :return A key of what the variable manager takes from a task besides its own vars:
+                    its role with the dependency chain, and its search path for vars plugins.
+        '''
+        role = task._role
+        dep_chain = tuple(dep._uuid for dep in task.get_dep_chain() or ())
+
+        return role and role._uuid, dep_chain, tuple(task.get_search_path())
+
+    def _play_roles(self, hostname):
+        '''
+            :return The uuids of the play's roles whose defaults and exported vars the host sees;
+                    roles included with public: true join them during the play.
+        '''
+        return tuple(
+            role._uuid for role in self.play.get_roles()
+            if role.static or role.public and role._completed.get(hostname, False)
+        )
+
+    def _stand_in(self, task, task_context):
+        '''
+            :return A copy of the task and its parents without vars, which the variable manager
+                    resolves like the task minus its task vars and include params.
+        '''
+        stand_in = self._stand_ins.get(task_context)
+        if stand_in is None:
+            stand_in = self._stand_ins[task_context] = task.copy(exclude_tasks=True)
+            parent = stand_in
+            while parent is not None:
+                parent.vars = {}
+                parent = parent._parent
+
+        return stand_in
+
+    def _resolve(self, host, task, task_context):
+        allvars = self.variable_manager.get_vars(play=self.play, host=host, task=self._stand_in(task, task_context))['vars']
+        self._hostvars = allvars['hostvars']
+
+        return dict((name, allvars.get(name)) for name in self.names)
+
+    def _fallback(self, hostname, name):
+        '''
+            :return The templated value of a variable in hostvars, which is what a falsy raw value
+                    falls back to.
+        '''
+        fallback = self._fallbacks.get(hostname)
+        if fallback is None:
+            # hostvars[hostname] resolves the host once and then templates one variable per lookup
+            fallback = self._fallbacks[hostname] = (self._hostvars[hostname], {})
+
+        hostvars, values = fallback
+        if name not in values:
+            values[name] = hostvars[name] if name in hostvars else None
+
+        return values[name]
+
+
+class SubstringAutomaton:
+    '''
+        Aho-Corasick automaton answering whether a text contains any of a set of substrings
+        in a single pass over the text.
+    '''
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] = True
+
+        # Breadth first so that a state's failure link is final before its children need it
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] or self.output[self.fail[child]]
+                queue.append(child)
+
+    def search(self, text):
+        '''
+            :return True if any of the patterns occurs in text.
+        '''
+        if self.output[0]:
+            return True
+
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+
+class HostSampler:
+    '''
+        Chooses which hosts are recorded when no record_hosts are given.
+
+        The per_group and reservoir modes select their hosts up front from the play's inventory;
+        the percent mode decides per host from a seeded hash of its name.
+    '''
+
+    def __init__(self, mode, size, percent, seed, play):
+        self.mode = mode
+        self.seed = seed
+        self.threshold = int(percent * 100)
+        self.hosts = None
+
+        if mode in ('per_group', 'reservoir'):
+            inventory = play.get_variable_manager()._inventory
+            play_hosts = [host.get_name() for host in inventory.get_hosts(play.hosts)]
+
+            if mode == 'per_group':
+                self.hosts = self._per_group(inventory, set(play_hosts), size)
+            else:
+                self.hosts = self._reservoir(play_hosts, size)
+
+    def _rank(self, hostname):
+        digest = hashlib.blake2b(f"{self.seed}:{hostname}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def _per_group(self, inventory, play_hosts, size):
+        selected = set()
+        for name, group in inventory.groups.items():
+            if name == 'all':
+                continue
+            members = [host.get_name() for host in group.hosts if host.get_name() in play_hosts]
+            selected.update(sorted(members, key=self._rank)[:size])
+        return selected
+
+    def _reservoir(self, play_hosts, size):
+        rng = random.Random(self.seed)
+        reservoir = []
+        for index, hostname in enumerate(play_hosts):
+            if index < size:
+                reservoir.append(hostname)
+            else:
+                slot = rng.randint(0, index)
+                if slot < size:
+                    reservoir[slot] = hostname
+        return set(reservoir)
+
+    def sample(self, hostname):
+        if self.hosts is not None:
+            return hostname in self.hosts
+        return self._rank(hostname) % 10000 < self.threshold
+
+
+class RecordMatcher:
+    '''
+        Decides which hosts and tasks are recorded. Built once per play from record_hosts and record_tasks.
+
+        Plain host entries are exact names and plain task entries are substrings of the task name.
+        Entries starting with `~` are regular expressions and entries starting with `%` are glob patterns.
+        Decisions are memoized per host name and per task UUID.
+        When no hosts are given, an optional HostSampler limits which hosts are recorded.
+    '''
+
+    def __init__(self, hosts, tasks, sampler=None):
+        self.host_names, self.host_patterns = self._compile(hosts, anchored=True)
+        task_substrings, self.task_patterns = self._compile(tasks, anchored=False)
+        self.task_automaton = SubstringAutomaton(task_substrings)
+
+        self.match_all_hosts = not hosts and sampler is None
+        self.sampler = sampler if not hosts else None
+        self.match_all_tasks = not tasks
+
+        self._hosts = {}
+        self._tasks = {}
+
+    @staticmethod
+    def _compile(entries, anchored):
+        '''
+            :return A set of plain entries and a list of compiled regular expressions.
+        '''
+        plain = set()
+        patterns = []
+
+        for entry in entries:
+            entry = str(entry)
+            try:
+                if entry.startswith('~'):
+                    pattern = re.compile(entry[1:])
+                    patterns.append(pattern.fullmatch if anchored else pattern.search)
+                elif entry.startswith('%'):
+                    # globs always match the whole name
+                    patterns.append(re.compile(fnmatch.translate(entry[1:])).fullmatch)
+                else:
+                    plain.add(entry)
+            except re.error as e:
+                raise AnsibleError(f"Invalid pattern '{entry}': {e}")
+
+        return plain, patterns
+
+    def match_host(self, hostname):
+        if self.match_all_hosts or hostname in self.host_names:
+            return True
+
+        matched = self._hosts.get(hostname)
+        if matched is None:
+            if self.sampler is not None:
+                matched = self.sampler.sample(hostname)
+            else:
+                matched = any(match(hostname) for match in self.host_patterns)
+            self._hosts[hostname] = matched
+        return matched
+
+    def match_task(self, task):
+        if self.match_all_tasks:
+            return True
+
+        matched = self._tasks.get(task._uuid)
+        if matched is None:
+            taskname = task.get_name()
+            matched = self._tasks[task._uuid] = (
+                self.task_automaton.search(taskname) or any(match(taskname) for match in self.task_patterns)
+            )
+        return matched
+
+
+class DeltaSink:
+    '''
+        Rewrites records as JSON-patch style deltas against the previous record of the same host
+        before passing them on to another sink.
+
+        Only a short digest of the last value seen is kept for each (host, path), and the patch
+        holds add/replace operations for values that changed and remove operations for values
+        that are gone.
+    '''
+
+    SECTIONS = ('task_arguments', 'task_variables', 'tracked_variables')
+
+    def __init__(self, sink):
+        self.sink = sink
+
+        # hostname -> {json pointer: digest}
+        self._seen = {}
+
+    @staticmethod
+    def digest(value):
+        try:
+            encoded = json.dumps(value, sort_keys=True, default=str)
+        except TypeError:
+            encoded = repr(value)
+        return hashlib.blake2b(encoded.encode('utf-8'), digest_size=8).digest()
+
+    @staticmethod
+    def pointer(section, name):
+        name = str(name).replace('~', '~0').replace('/', '~1')
+        return f"/{section}/{name}"
+
+    def encode(self, record):
+        seen = self._seen.setdefault(record['host'], {})
+        current = set()
+        patch = []
+
+        for section in self.SECTIONS:
+            for name, value in record[section].items():
+                path = self.pointer(section, name)
+                current.add(path)
+
+                digest = self.digest(value)
+                previous = seen.get(path)
+                if previous != digest:
+                    patch.append({'op': 'add' if previous is None else 'replace', 'path': path, 'value': value})
+                    seen[path] = digest
+
+        for path in [path for path in seen if path not in current]:
+            patch.append({'op': 'remove', 'path': path})
+            del seen[path]
+
+        delta = dict((key, value) for key, value in record.items() if key not in self.SECTIONS)
+        delta['patch'] = patch
+        return delta
+
+    def write(self, record):
+        self.sink.write(self.encode(record))
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+class ThreadedSink:
+    '''
+        Passes records to another sink on a background thread through a bounded queue.
+
+        Records are processed in the order they were written. flush() waits until everything queued
+        so far has been written; close() also stops the thread and reports the first error it hit.
+    '''
+
+    CLOSE = object()
+
+    def __init__(self, sink, queue_size):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.error = None
+
+        self.thread = threading.Thread(target=self._run, name='profile_variables-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self.CLOSE:
+                # the thread stops even when closing fails, so close() never waits for it forever
+                try:
+                    self.sink.close()
+                except Exception as e:
+                    self.error = self.error or e
+                return
+
+            try:
+                if isinstance(item, threading.Event):
+                    self.sink.flush()
+                    item.set()
+                else:
+                    self.sink.write(item)
+            except Exception as e:
+                self.error = self.error or e
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        self.queue.put(self.CLOSE)
+        self.thread.join()
+
+        if self.error is not None:
+            raise AnsibleError(f"Writing profile_variables output failed: {self.error}")
+
+
+class SummarySink:
+    '''
+        Keeps every record and displays them as one pretty-printed JSON document when closed.
+
+        With max_records set, records beyond that count are spilled as JSON lines to a temporary
+        file and read back one at a time when the summary is displayed.
+    '''
+
+    def __init__(self, display, max_records=0, spill_dir=None):
+        self.display = display
+        self.max_records = max_records
+        self.spill_dir = spill_dir
+        self.records = []
+        self.spill = None
+
+    def write(self, record):
+        self.records.append(record)
+        if self.max_records and len(self.records) >= self.max_records:
+            self._spill()
+
+    def _spill(self):
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=self.spill_dir, prefix='profile_variables-')
+        self.spill.writelines(json.dumps(record, default=str) + '\n' for record in self.records)
+        self.records = []
+
+    def _iter_records(self):
+        if self.spill is not None:
+            self.spill.seek(0)
+            for line in self.spill:
+                yield json.loads(line)
+        yield from self.records
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.spill is None:
+            self.display.display(json.dumps(self.records, indent=4, default=str))
+            self.records = []
+            return
+
+        # Same layout as json.dumps(records, indent=4), displayed one record at a time
+        self.display.display('[')
+        previous = None
+        for record in self._iter_records():
+            if previous is not None:
+                self.display.display(previous + ',')
+            previous = '\n'.join('    ' + line for line in json.dumps(record, indent=4, default=str).splitlines())
+        self.display.display(previous)
+        self.display.display(']')
+
+        self.spill.close()
+        self.spill = None
+        self.records = []
+
+
+class OutputStream:
+    '''
+        Binary output file or file descriptor, optionally behind a gzip or zstd compressor.
+    '''
+
+    def __init__(self, raw, compression):
+        self.raw = raw
+
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=raw, mode='wb')
+        elif compression == 'zstd':
+            if not HAS_ZSTANDARD:
+                raise AnsibleError("The 'zstandard' Python library is required for zstd compressed profile_variables output")
+            self.stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            self.stream = raw
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        if self.stream is not self.raw:
+            self.raw.flush()
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+
+class StreamSink:
+    '''
+        Writes each record as one JSON line, in batches of `flush_records`.
+    '''
+
+    def __init__(self, stream, flush_records):
+        self.stream = stream
+        self.flush_records = max(flush_records, 1)
+        self.pending = []
+
+    def encode(self, record):
+        return (json.dumps(record, default=str, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def write(self, record):
+        self.pending.append(self.encode(record))
+        if len(self.pending) >= self.flush_records:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.stream.write(b''.join(self.pending))
+            self.pending = []
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+
+class CborSink(StreamSink):
+    '''
+        Writes records as length-prefixed CBOR (RFC 8949) frames after a CBOR_MAGIC header.
+
+        Each frame is a 4 byte big-endian length followed by one CBOR array:
+          [0, text]                       defines the next interned string (numbered from 0)
+          [1, host, task, event, body]    a record; host, task and event are interned string numbers
+                                          and body is a map of the remaining record keys
+        Values CBOR cannot represent are written as their string form, like json.dumps(default=str).
+    '''
+
+    def __init__(self, stream, flush_records):
+        super(CborSink, self).__init__(stream, flush_records)
+        self.strings = {}
+        self.pending.append(CBOR_MAGIC)
+
+    def intern(self, frames, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+            frames.append(self.frame([0, text]))
+        return index
+
+    def frame(self, item):
+        buf = bytearray()
+        self.dump(item, buf)
+        return struct.pack('>I', len(buf)) + bytes(buf)
+
+    def encode(self, record):
+        frames = []
+        refs = [self.intern(frames, str(record.get(key, ''))) for key in ('host', 'task', 'event')]
+        body = dict((key, value) for key, value in record.items() if key not in ('host', 'task', 'event'))
+        frames.append(self.frame([1, *refs, body]))
+        return b''.join(frames)
+
+    @staticmethod
+    def head(major, value, buf):
+        if value < 24:
+            buf.append(major << 5 | value)
+        elif value < 0x100:
+            buf += struct.pack('>BB', major << 5 | 24, value)
+        elif value < 0x10000:
+            buf += struct.pack('>BH', major << 5 | 25, value)
+        elif value < 0x100000000:
+            buf += struct.pack('>BI', major << 5 | 26, value)
+        else:
+            buf += struct.pack('>BQ', major << 5 | 27, value)
+
+    def dump(self, value, buf):
+        if value is None:
+            buf.append(0xf6)
+        elif value is True:
+            buf.append(0xf5)
+        elif value is False:
+            buf.append(0xf4)
+        elif isinstance(value, int) and -2 ** 64 <= value < 2 ** 64:
+            if value >= 0:
+                self.head(0, value, buf)
+            else:
+                self.head(1, -1 - value, buf)
+        elif isinstance(value, float):
+            buf.append(0xfb)
+            buf += struct.pack('>d', value)
+        elif isinstance(value, str):
+            try:
+                encoded = value.encode('utf-8')
+            except UnicodeEncodeError:
+                encoded = value.encode('utf-8', 'replace')
+            self.head(3, len(encoded), buf)
+            buf += encoded
+        elif isinstance(value, bytes):
+            self.head(2, len(value), buf)
+            buf += value
+        elif isinstance(value, dict):
+            self.head(5, len(value), buf)
+            for key, item in value.items():
+                self.dump(key, buf)
+                self.dump(item, buf)
+        elif isinstance(value, (list, tuple)):
+            self.head(4, len(value), buf)
+            for item in value:
+                self.dump(item, buf)
+        else:
+            self.dump(str(value), buf)
+
+
 class CallbackModule(CallbackBase):
 
     CALLBACK_VERSION = 2.0
@@ -286,11 +1335,56 @@ class CallbackModule(CallbackBase):
         self.record_vars = None
         self.record_hosts = None
 
-        self.output = []
+        self.sink = None
         self.play = None
+        self.snapshots = None
+        self.matcher = None
+        self.record_on = None
+        self.timing = None
 
         super(CallbackModule, self).__init__()
 
+    def open_sink(self):
+        sink = self.open_output()
+
+        if self.get_option('record_mode') == 'delta':
+            sink = DeltaSink(sink)
+
+        if self.get_option('output_thread'):
+            sink = ThreadedSink(sink, self.get_option('output_queue_size'))
+
+        return sink
+
+    def open_output(self):
+        output_mode = self.get_option('output_mode')
+
+        if output_mode == 'summary':
+            return SummarySink(self._display, self.get_option('max_records'), self.get_option('spill_dir'))
+
+        output_path = self.get_option('output_path')
+        output_fd = self.get_option('output_fd')
+
+        try:
+            if output_path:
+                raw = open(output_path, 'wb')
+            elif output_fd is not None:
+                raw = os.fdopen(output_fd, 'wb', closefd=False)
+            else:
+                raise AnsibleError("The profile_variables 'stream' output mode requires 'output_path' or 'output_fd'")
+        except OSError as e:
+            raise AnsibleError(f"Unable to open profile_variables output: {e}")
+
+        try:
+            stream = OutputStream(raw, self.get_option('output_compression'))
+        except AnsibleError:
+            raw.close()
+            raise
+
+        self.print_out(f"Streaming recorded variables to {output_path or f'fd {output_fd}'} ...")
+        if self.get_option('output_format') == 'cbor':
+            return CborSink(stream, self.get_option('output_flush_records'))
+        return StreamSink(stream, self.get_option('output_flush_records'))
+
     def print_out(self, s):
         self._display.display(f"{s}")
 
@@ -313,7 +1407,7 @@ class CallbackModule(CallbackBase):
         self.print_out(f"{name}={retval}")
         return retval
 
-    def record(self, host, task):
+    def record(self, host, task, event):
         hostname = host.get_name()
         taskname = task.get_name()
 
@@ -322,31 +1416,45 @@ class CallbackModule(CallbackBase):
             return
 
         # If a host list is specified, only record tasks for that host
-        if self.record_hosts and hostname not in self.record_hosts:
+        if not self.matcher.match_host(hostname):
             return
 
         # If a task list is specified, only record tasks that pattern match
-        if self.record_tasks and not any([wanted_taskname in taskname for wanted_taskname in self.record_tasks]):
+        if not self.matcher.match_task(task):
             return
 
-        allvars = self.play.get_variable_manager().get_vars(play=self.play, host=host, task=task)['vars']
-        hostvars = dict(allvars['hostvars'][hostname])
+        task_vars = task.get_vars()
 
-        retvars = {}
-        for wanted_var in self.record_vars:
-            retvars[wanted_var] = allvars.get(wanted_var) or hostvars.get(wanted_var) or 'VARIABLE IS UNDEFINED'
+        # Tasks handed back with results carry the executor's internal _ansible_* arguments
+        task_args = dict((key, value) for key, value in task.args.items() if not key.startswith('_ansible_'))
 
-        self.output.append({
+        record = {
             'host': hostname,
             'task': taskname,
-            'task_arguments': task.args,
-            'task_variables': task.get_vars(),
-            'tracked_variables': retvars
-        })
+            'event': event,
+            'task_arguments': task_args,
+            'task_variables': task_vars,
+            'tracked_variables': self.snapshots.get(host, task, task_vars)
+        }
+
+        self.sink.write(record)
 
     def v2_playbook_on_play_start(self, play):
         self.play = play
 
+        if self.sink is None:
+            self.record_on = self.get_option('record_on')
+
+            if self.get_option('profile_timing'):
+                self.timing = TimingProfile()
+
+            try:
+                self.sink = self.open_sink()
+            except AnsibleError as e:
+                self._display.warning(f"Disabling the profile_variables callback: {e}")
+                self.disabled = True
+                return
+
         extra_vars = self.play.get_variable_manager().extra_vars
 
         self.record_tasks = self.parse_var(
@@ -364,8 +1472,84 @@ class CallbackModule(CallbackBase):
             extra_vars.get('profile_variables_record_hosts') or self.get_option('record_hosts')
         )
 
+        sampler = None
+        if self.get_option('sample_mode') != 'none':
+            sampler = HostSampler(
+                self.get_option('sample_mode'),
+                self.get_option('sample_size'),
+                self.get_option('sample_percent'),
+                self.get_option('sample_seed'),
+                self.play
+            )
+
+        try:
+            self.matcher = RecordMatcher(self.record_hosts, self.record_tasks, sampler)
+        except AnsibleError as e:
+            self._display.warning(f"Disabling the profile_variables callback: {e}")
+            self.disabled = True
+            return
+
+        self.snapshots = VariableSnapshots(self.play, self.record_vars, self.timing and self.timing.resolving)
+
+    def timed_record(self, host, task, event):
+        if self.timing is None:
+            self.record(host, task, event)
+            return
+
+        started = time.perf_counter()
+        self.record(host, task, event)
+        self.timing.recording.add(time.perf_counter() - started)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        if self.timing is not None:
+            self.timing.task_start(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        if self.timing is not None:
+            self.timing.task_start(task)
+
     def v2_runner_on_start(self, host, task):
-        self.record(host, task)
+        if self.timing is not None:
+            self.timing.runner_start(host, task)
+
+        if self.record_on in ('start', 'both'):
+            self.timed_record(host, task, 'start')
+
+    def v2_runner_on_ok(self, result):
+        if self.timing is not None:
+            self.timing.runner_end(result)
+
+        self.snapshots.update(result)
+
+        if self.record_on in ('ok', 'both'):
+            self.timed_record(result._host, result._task, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        if self.timing is not None:
+            self.timing.runner_end(result)
+
+        self.snapshots.update(result)
+
+    def v2_runner_on_skipped(self, result):
+        if self.timing is not None:
+            self.timing.runner_end(result)
+
+        self.snapshots.update(result)
+
+    def v2_runner_on_unreachable(self, result):
+        if self.timing is not None:
+            self.timing.runner_end(result)
 
     def v2_playbook_on_stats(self, stats):
-        self.print_out(json.dumps(self.output, indent=4, default=str))
\ No newline at end of file
+        if self.sink is not None:
+            try:
+                self.sink.flush()
+                self.sink.close()
+            except AnsibleError as e:
+                self._display.warning(str(e))
+            self.sink = None
+
+        if self.timing is not None:
+            for line in self.timing.summary():
+                self.print_out(line)
+            self.timing = None
\ No newline at end of file
@@ -11,6 +11,15 @@ DOCUMENTATION = r'''
     description:
         - Retrieves inventory from DNA Center
         - Adds inventory to ansible working inventory
+        - Supports the inventory cache, which stores the normalized host and site records so that a cache hit
+          does not log in to DNA Center at all.
+        - Supports C(compose), C(groups) and C(keyed_groups), evaluated for each host while the inventory is built.
+          Besides the host variables, the expressions can use the fields of the DNAC device record C(hostname),
+          C(managementIpAddress), C(role), C(series), C(version), C(reachabilityStatus), C(serialNumber) and C(siteId).
+
+    extends_documentation_fragment:
+        - constructed
+        - inventory_cache
 
     options:
         plugin:
@@ -45,6 +54,40 @@ DOCUMENTATION = r'''
         api_record_limit:
             description: DNAC API calls return maximum of <api_record_limit> records per invocation. Defaults to 500 records
             required: true
+        group_connection_vars:
+            description:
+                - Set the connection variables shared by IOS and NX-OS devices (ansible_network_os, ansible_connection,
+                  ansible_become, ansible_become_method) once on C(ios) and C(nxos) groups instead of on every host
+            required: false
+            default: false
+            type: bool
+        api_pool_size:
+            description: Number of keep-alive HTTPS connections kept open to DNAC. At least api_workers connections are pooled
+            required: false
+            default: 10
+            type: int
+        api_retries:
+            description: Number of times a DNAC API call is retried after a rate limit (429) or server (5xx) error
+            required: false
+            default: 5
+            type: int
+        api_backoff:
+            description:
+                - Base delay in seconds between retries of a DNAC API call. The delay doubles with every retry, is randomized
+                  (full jitter) and is never shorter than the Retry-After of a rate limit response
+            required: false
+            default: 1.0
+            type: float
+        api_backoff_max:
+            description: Maximum delay in seconds between retries of a DNAC API call
+            required: false
+            default: 30.0
+            type: float
+        api_workers:
+            description: Number of device inventory pages fetched from DNAC concurrently
+            required: false
+            default: 4
+            type: int
 '''
 
 EXAMPLES = r'''
@@ -56,20 +99,46 @@ EXAMPLES = r'''
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.module_utils._text import to_bytes, to_native
 from ansible.parsing.utils.addresses import parse_address
-from ansible.plugins.inventory import BaseInventoryPlugin
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
 
+import inspect
 import json
+import random
 import sys
 import math
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 try:
     import requests, urllib3
+    from requests.adapters import HTTPAdapter
     from dnacentersdk import DNACenterAPI
     from dnacentersdk import ApiError
 except ImportError as e:
     raise AnsibleError('Python requests module is required for this plugin. Error: %s' % to_native(e))
 
-class InventoryModule(BaseInventoryPlugin):
+IOS_CONNECTION_VARS = {
+    'ansible_network_os': 'ios',
+    'ansible_connection': 'network_cli',
+    'ansible_become': 'yes',
+    'ansible_become_method': 'enable',
+}
+
+NXOS_CONNECTION_VARS = dict(IOS_CONNECTION_VARS, ansible_network_os='nxos')
+
+# lowercase DNAC software type -> (connection group, connection variables)
+CONNECTION_VARS = {
+    'ios': ('ios', IOS_CONNECTION_VARS),
+    'ios-xe': ('ios', IOS_CONNECTION_VARS),
+    'unified ap': ('ios', IOS_CONNECTION_VARS),
+    'nxos': ('nxos', NXOS_CONNECTION_VARS),
+    'nx-os': ('nxos', NXOS_CONNECTION_VARS),
+}
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
 
     NAME = 'dna_center'
 
@@ -85,10 +154,21 @@ class InventoryModule(BaseInventoryPlugin):
         self.use_dnac_mgmt_int = None
         self.toplevel = None
         self.api_record_limit = 500
+        self.api_workers = 4
+        self.group_connection_vars = False
+        self.api_pool_size = 10
+        self.api_retries = 5
+        self.api_backoff = 1.0
+        self.api_backoff_max = 30.0
+        self.compose = None
+        self.groups = None
+        self.keyed_groups = None
+        self.strict = False
 
         # global attributes
         self._site_list = None
-        self._inventory = []
+        self._site_names = None
+        self._device_sites = None
         self._host_list = None
         self._dnac_api = None
 
@@ -100,25 +180,75 @@ class InventoryModule(BaseInventoryPlugin):
         if not self.validate_certs:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+        # one pooled keep-alive session shared by all API calls, including the concurrent page fetches
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.api_pool_size, self.api_workers))
+        kwargs = {}
+
+        # dnacentersdk before 2.8.0 cannot be handed a session
+        inject_session = 'session' in inspect.signature(DNACenterAPI).parameters
+        if inject_session:
+            kwargs['session'] = requests.Session()
+            kwargs['session'].mount('https://', adapter)
+
         try:
-            self._dnac_api = DNACenterAPI(
+            self._dnac_api = self._call(
+                DNACenterAPI,
                 username=self.username,
                 password=self.password,
                 base_url='https://' + self.host,
                 version=self.dnac_version,
-                verify=self.validate_certs)
+                verify=self.validate_certs,
+                # rate limits are retried by _call() with backoff instead of the SDK's fixed sleep
+                wait_on_rate_limit=False,
+                **kwargs)
         except ApiError as e:
             raise AnsibleError('failed to login to DNA Center: %s' % to_native(e))
 
-            return self._dnac_api
+        if not inject_session:
+            # the pool then serves every call after the login
+            session = getattr(getattr(self._dnac_api, '_session', None), '_req_session', None)
+            if isinstance(session, requests.Session):
+                session.mount('https://', adapter)
+            else:
+                self.display.vvv('dna_center: this dnacentersdk does not expose its session, API connections are not pooled')
+
+        return self._dnac_api
+
+    def _call(self, method, *args, **kwargs):
+        '''
+            Call a DNAC SDK method, retrying rate limit (429) and server (5xx) errors with
+            exponential backoff and full jitter. Retries go through the same API object, so the
+            pooled connections and the access token are reused.
+            :param method: The SDK method to call.
+            :return The result of the call.
+        '''
+
+        attempt = 0
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except ApiError as e:
+                status_code = getattr(e, 'status_code', None) or 0
+                if attempt >= self.api_retries or not (status_code == 429 or 500 <= status_code < 600):
+                    raise
+
+                delay = random.uniform(0, min(self.api_backoff_max, self.api_backoff * 2 ** attempt))
+                delay = max(delay, getattr(e, 'retry_after', 0) or 0)
+                attempt += 1
+
+                self.display.vvv('dna_center: %s returned %d, retry %d of %d in %.1fs' % (
+                    getattr(method, '__name__', method), status_code, attempt, self.api_retries, delay))
+                time.sleep(delay)
 
     def _get_inventory(self):
         '''
-            :return The json output from the request object response.
+            Fetch the device inventory page by page. At most api_workers pages are requested
+            concurrently and every page is released as soon as its devices have been consumed.
+            :return A generator of the devices as returned by the DNAC API, in DNAC order.
         '''
 
         try:
-            device_count = (self._dnac_api.devices.get_device_count()).response
+            device_count = (self._call(self._dnac_api.devices.get_device_count)).response
         except ApiError as e:
             raise AnsibleParserError('Getting device count failed:  %s' % to_native(e))
 
@@ -126,49 +256,70 @@ class InventoryModule(BaseInventoryPlugin):
         # exceeds the api_record_limit
         offset_pages = math.ceil(device_count / self.api_record_limit)
 
-        for offset in range(offset_pages):
-            # DNAC API takes starting index of a device in a list
-            # beginning with index of '1'
-            start_index = offset * self.api_record_limit + 1
-            try:
-                inventory_results = (self._dnac_api.devices.get_network_device_by_pagination_range(
-                    records_to_return=self.api_record_limit,
-                    start_index=start_index)).response
-            except ApiError as e:
-                raise AnsibleParserError('Getting device inventory failed:  %s' % to_native(e))
+        # DNAC API takes starting index of a device in a list
+        # beginning with index of '1'
+        start_indexes = iter(range(1, offset_pages * self.api_record_limit + 1, self.api_record_limit))
+        workers = max(1, self.api_workers)
 
-            self._inventory = [*self._inventory, *inventory_results]
+        # a bounded window of pages is in flight; pages are handed out in request order
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(executor.submit(self._get_inventory_page, start_index)
+                            for start_index in islice(start_indexes, workers))
 
-        return self._inventory
+            while pending:
+                page = pending.popleft().result()
 
-    def _get_hosts(self):
+                start_index = next(start_indexes, None)
+                if start_index is not None:
+                    pending.append(executor.submit(self._get_inventory_page, start_index))
+
+                yield from page
+
+    def _get_inventory_page(self, start_index):
         '''
-             :param inventory A list of dictionaries representing the entire DNA Center inventory.
-             :return A List of tuples that include the management IP, device hostnanme, and the unique indentifier of the device.
+            :param start_index: Index of the first device of the page, beginning with 1.
+            :return A list of up to api_record_limit devices.
         '''
 
-        host_list = []
+        try:
+            return (self._call(
+                self._dnac_api.devices.get_network_device_by_pagination_range,
+                records_to_return=self.api_record_limit,
+                start_index=start_index)).response
+        except ApiError as e:
+            raise AnsibleParserError('Getting device inventory failed:  %s' % to_native(e))
+
+    def _get_hosts(self):
+        '''
+             :return A generator of the normalized host dictionaries of the devices fetched from DNA Center.
+        '''
 
-        for host in self._inventory:
+        for host in self._get_inventory():
             # do not inventorize Access Points
             if host['family'].find('Unified AP') == -1:
-                host_dict = {}
-                host_dict.update({
-                    'managementIpAddress': host['managementIpAddress'],
-                    'hostname' : host['hostname'],
-                    'id': host['id'],
-                    'os': (host['softwareType'] if host['family'].find('Unified AP') == -1 else host['family']),
-                    'version': host['softwareVersion'],
-                    'reachabilityStatus': host['reachabilityStatus'],
-                    'role': host['role'],
-                    'serialNumber': host['serialNumber'].split(', '),
-                    'series': host['series']
-                })
-                host_list.append(host_dict)
-
-        self._host_list = host_list
-
-        return host_list
+                yield self._normalize_host(host)
+
+    def _normalize_host(self, host):
+        '''
+            :param host: A device dictionary as returned by the DNAC API.
+            :return The host dictionary the plugin keeps for the device.
+        '''
+
+        host_dict = {}
+        host_dict.update({
+            'managementIpAddress': host['managementIpAddress'],
+            'hostname' : host['hostname'],
+            'id': host['id'],
+            'os': (host['softwareType'] if host['family'].find('Unified AP') == -1 else host['family']),
+            'version': host['softwareVersion'],
+            'reachabilityStatus': host['reachabilityStatus'],
+            'role': host['role'],
+            'serialNumber': host['serialNumber'].split(', '),
+            'series': host['series'],
+            'siteId': self._device_sites.get(host['id'])
+        })
+
+        return host_dict
 
     def _get_sites(self):
         '''
@@ -176,7 +327,7 @@ class InventoryModule(BaseInventoryPlugin):
         '''
 
         try:
-            sites = (self._dnac_api.topology.get_site_topology()).response.sites
+            sites = (self._call(self._dnac_api.topology.get_site_topology)).response.sites
         except ApiError as e:
             raise AnsibleError('Getting site topology failed:  %s' % to_native(e))
 
@@ -196,35 +347,39 @@ class InventoryModule(BaseInventoryPlugin):
             site_list.append(site_dict)
 
         self._site_list = site_list
+        self._site_names = dict((site['id'], site['name']) for site in site_list)
 
         return site_list
 
-
-    def _get_member_site(self, device_id):
+    def _get_device_sites(self):
         '''
-            :param device_id: The unique identifier of the target device.
-            :return A single string representing the name of the SITE group of which the device is a member.
+            Fetch the physical topology once and index the site of every device.
+            :return A dictionary mapping device id to site id.
         '''
 
         try:
-            devices = (self._dnac_api.topology.get_physical_topology()).response.nodes
+            devices = (self._call(self._dnac_api.topology.get_physical_topology)).response.nodes
         except ApiError as e:
             raise AnsibleError('Getting member site failed: %s' % to_native(e))
 
-        # Get the one device we are looking for
-        device = [ dev for dev in devices if dev['id'] == device_id ][0]
+        self._device_sites = dict(
+            (dev['id'], (dev.get('additionalInfo') or {}).get('siteid')) for dev in devices
+        )
 
-        # Extract the siteid from the device data
-        site_id = device.get('additionalInfo').get('siteid')
+        return self._device_sites
 
-        # set the site name from the self._site_list
-        site_name = [ site['name'] for site in self._site_list if site['id'] == site_id ]
 
-        # return the name if it exists
-        if len(site_name) == 1:
-            return site_name[0]
-        elif len(site_name) == 0:
-            return 'ungrouped'
+    def _get_member_site(self, device_id):
+        '''
+            :param device_id: The unique identifier of the target device.
+            :return A single string representing the name of the SITE group of which the device is a member.
+        '''
+
+        # Extract the siteid from the indexed physical topology
+        site_id = self._device_sites.get(device_id)
+
+        # return the site name if it exists
+        return self._site_names.get(site_id, 'ungrouped')
 
 
     def _add_sites(self):
@@ -232,70 +387,144 @@ class InventoryModule(BaseInventoryPlugin):
             :param site_list: list of group dictionaries containing name, id, parentId
         '''
 
+        sites_by_id = dict((site['id'], site) for site in self._site_list)
+
+        # Index children by parent id; sites without a known parent are the roots of the hierarchy.
         # Global is a system group and the parent of all top level groups
-        site_ids = [ ste['id'] for ste in self._site_list ]
-        parent_name = ''
+        children = {}
+        roots = []
+        orphans = []
+
+        for site in self._site_list:
+            if site['parentId'] in sites_by_id:
+                children.setdefault(site['parentId'], []).append(site)
+            else:
+                roots.append(site)
+                if site['parentId']:
+                    orphans.append(site['name'])
+
+        if orphans:
+            self.display.vvv('dna_center: sites with an unknown parent are added at the top level: %s' % ', '.join(orphans))
 
         if self.toplevel:
             self.inventory.add_group(self.toplevel)
 
-        # Add all sites
-        for site in self._site_list:
-            self.inventory.add_group(site['name'])
-
-        # Add parent/child relationship
-        for site in self._site_list:
+        # Add all sites top-down so every parent group exists before its children are linked to it
+        pending = deque(roots)
+        reached = set(site['id'] for site in roots)
 
-            if site['parentId'] in site_ids:
-                parent_name = [ ste['name'] for ste in self._site_list if ste['id'] == site['parentId'] ][0]
-                try:
-                    self.inventory.add_child(parent_name, site['name'])
-                except Exception as e:
-                    raise AnsibleParserError('adding child sites failed:  {} \n {}:{}'.format(e,site['name'],parent_name))
-            elif self.toplevel:
+        for site in roots:
+            self.inventory.add_group(site['name'])
+            if self.toplevel:
                 try:
                     self.inventory.add_child(self.toplevel, site['name'])
                 except Exception as e:
-                    raise AnsibleParserError('adding child sites failed:  {} \n {}:{}'.format(e,site['name'],parent_name))
+                    raise AnsibleParserError('adding child sites failed:  {} \n {}:{}'.format(e, site['name'], self.toplevel))
 
+        while pending:
+            parent = pending.popleft()
 
+            for site in children.get(parent['id'], []):
+                self.inventory.add_group(site['name'])
+                try:
+                    self.inventory.add_child(parent['name'], site['name'])
+                except Exception as e:
+                    raise AnsibleParserError('adding child sites failed:  {} \n {}:{}'.format(e, site['name'], parent['name']))
+                reached.add(site['id'])
+                pending.append(site)
+
+        # Sites never reached from a root only have ancestors among themselves
+        if len(reached) != len(sites_by_id):
+            cycle = [site['name'] for site in self._site_list if site['id'] not in reached]
+            raise AnsibleParserError('site hierarchy contains a cycle between sites: %s' % ', '.join(cycle))
 
-    def _add_hosts(self):
+    def _add_hosts(self, host_list):
         """
             Add the devicies from DNAC Inventory to the Ansible Inventory
-            :param host_list: list of dictionaries for hosts retrieved from DNAC
+            :param host_list: iterable of dictionaries for hosts retrieved from DNAC
 
         """
-        for h in self._host_list:
+        connection_groups = set()
+        constructed = self.compose or self.groups or self.keyed_groups
+
+        for h in host_list:
             site_name = self._get_member_site( h['id'] )
             if site_name:
-                self.inventory.add_host(h['hostname'], group=site_name)
+                hostname = self.inventory.add_host(h['hostname'], group=site_name)
 
                 #  add variables to the hosts
+                host_vars = {}
                 if self.use_dnac_mgmt_int:
-                    self.inventory.set_variable(h['hostname'],'ansible_host',h['managementIpAddress'])
+                    host_vars['ansible_host'] = h['managementIpAddress']
 
-                self.inventory.set_variable(h['hostname'], 'os', h['os'])
-                self.inventory.set_variable(h['hostname'], 'version', h['version'])
-                self.inventory.set_variable(h['hostname'], 'reachability_status', h['reachabilityStatus'])
-                self.inventory.set_variable(h['hostname'], 'serial_number', h['serialNumber'])
-                self.inventory.set_variable(h['hostname'], 'hw_type', h['series'])
+                host_vars['os'] = h['os']
+                host_vars['version'] = h['version']
+                host_vars['reachability_status'] = h['reachabilityStatus']
+                host_vars['serial_number'] = h['serialNumber']
+                host_vars['hw_type'] = h['series']
                 # DNAC API calls operate on id of each managed element
-                self.inventory.set_variable(h['hostname'], 'id', h['id'])
-
-                if h['os'].lower() in ['ios', 'ios-xe', 'unified ap']:
-                    self.inventory.set_variable(h['hostname'], 'ansible_network_os', 'ios')
-                    self.inventory.set_variable(h['hostname'], 'ansible_connection', 'network_cli')
-                    self.inventory.set_variable(h['hostname'], 'ansible_become', 'yes')
-                    self.inventory.set_variable(h['hostname'], 'ansible_become_method', 'enable')
-                elif h['os'].lower() in ['nxos','nx-os']:
-                    self.inventory.set_variable(h['hostname'], 'ansible_network_os', 'nxos')
-                    self.inventory.set_variable(h['hostname'], 'ansible_connection', 'network_cli')
-                    self.inventory.set_variable(h['hostname'], 'ansible_become', 'yes')
-                    self.inventory.set_variable(h['hostname'], 'ansible_become_method', 'enable')
+                host_vars['id'] = h['id']
+
+                connection = CONNECTION_VARS.get(h['os'].lower())
+                if connection:
+                    group, connection_vars = connection
+                    if self.group_connection_vars:
+                        if group not in connection_groups:
+                            self._add_connection_group(group, connection_vars)
+                            connection_groups.add(group)
+                        self.inventory.add_child(group, hostname)
+                    else:
+                        host_vars.update(connection_vars)
+
+                host = self.inventory.get_host(hostname)
+                for varname, value in host_vars.items():
+                    host.set_variable(varname, value)
+
+                if constructed:
+                    self._add_constructed(hostname, h, host_vars)
             else:
                 raise AnsibleError('no site name found for host: {} with site_id {}'.format(h['id'], self._site_list))
 
+    def _add_constructed(self, hostname, h, host_vars):
+        '''
+            Apply the compose, groups and keyed_groups options to a host.
+            :param hostname: Name of the host in the inventory.
+            :param h: The normalized DNAC device record of the host.
+            :param host_vars: The variables set on the host.
+        '''
+
+        variables = dict(h)
+        variables.update(host_vars)
+        self._set_composite_vars(self.compose, variables, hostname, strict=self.strict)
+
+        # the groups and keyed_groups expressions also see the composed variables of the host
+        self._add_host_to_composed_groups(self.groups, variables, hostname, strict=self.strict)
+        self._add_host_to_keyed_groups(self.keyed_groups, variables, hostname, strict=self.strict)
+
+    def _add_connection_group(self, group, connection_vars):
+        '''
+            Add a group holding the connection variables shared by every host of a network OS.
+            :param group: Name of the group, 'ios' or 'nxos'.
+            :param connection_vars: Dictionary of connection variables.
+        '''
+
+        self.inventory.add_group(group)
+        for varname, value in connection_vars.items():
+            self.inventory.set_variable(group, varname, value)
+
+
+    def _load_cached(self, cached):
+        '''
+            Restore the normalized site and host records saved in the inventory cache.
+            :param cached: A dictionary with the 'sites' and 'hosts' lists.
+        '''
+
+        self._site_list = cached['sites']
+        self._site_names = dict((site['id'], site['name']) for site in self._site_list)
+
+        self._host_list = cached['hosts']
+        self._device_sites = dict((h['id'], h['siteId']) for h in self._host_list)
+
 
     def verify_file(self, path):
 
@@ -326,19 +555,54 @@ class InventoryModule(BaseInventoryPlugin):
             self.validate_certs = self.get_option('validate_certs')
             self.toplevel = self.get_option('toplevel')
             self.api_record_limit = self.get_option('api_record_limit')
+            self.api_workers = self.get_option('api_workers')
+            self.group_connection_vars = self.get_option('group_connection_vars')
+            self.api_pool_size = self.get_option('api_pool_size')
+            self.api_retries = self.get_option('api_retries')
+            self.api_backoff = self.get_option('api_backoff')
+            self.api_backoff_max = self.get_option('api_backoff_max')
+            self.compose = self.get_option('compose') or {}
+            self.groups = self.get_option('groups') or {}
+            self.keyed_groups = self.get_option('keyed_groups') or []
+            self.strict = self.get_option('strict')
         except Exception as e:
             raise AnsibleParserError('getting options failed:  %s' % to_native(e))
 
-        # Attempt login to DNAC
-        self._login()
+        cache_key = self.get_cache_key(path)
+
+        # cache is False when the inventory is being refreshed; the user's cache option
+        # decides whether the refreshed data is saved
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        if attempt_to_read_cache:
+            try:
+                self._load_cached(self._cache[cache_key])
+            except KeyError:
+                cache_needs_update = True
+
+        if not attempt_to_read_cache or cache_needs_update:
+            # Attempt login to DNAC
+            self._login()
+
+            # Obtain the sites first, so that devices can be added as their pages arrive
+            self._get_sites()
+            self._get_device_sites()
 
-        # Obtain Inventory Data
-        self._get_inventory()
+            host_list = self._get_hosts()
+
+            # only the cache needs all normalized hosts at once
+            if cache_needs_update:
+                host_list = self._host_list = list(host_list)
+        else:
+            host_list = self._host_list
 
         # Add groups to the inventory
-        self._get_sites()
         self._add_sites()
 
         # Add the hosts to the inventory
-        self._get_hosts()
-        self._add_hosts()
+        self._add_hosts(host_list)
+
+        if cache_needs_update:
+            self._cache[cache_key] = {'sites': self._site_list, 'hosts': self._host_list}
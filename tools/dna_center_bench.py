@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+'''
+Benchmark the dna_center inventory plugin end to end without a DNA Center.
+
+Runs InventoryModule.parse() against tools/dna_center_stub.py for synthetic fleets of the
+given sizes (or a replayed fixture) and reports the wall-clock time, the resulting hosts and
+groups, and the number of API calls by method. With --check the run fails when a parse
+makes more API calls than one login, one device count, one call per page and one call per
+topology, which catches per-host API calls before they reach production.
+
+    tools/dna_center_bench.py --devices 1000 10000 50000
+    tools/dna_center_bench.py --devices 10000 --latency 0.2 --workers 8
+    tools/dna_center_bench.py --devices 10000 --save-fixture fleet.json
+    tools/dna_center_bench.py --fixture fleet.json --check
+'''
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import dna_center_stub
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugins', 'inventory')
+
+# The plugin imports dnacentersdk when it is loaded, so the stub must be registered first
+dna_center_stub.install()
+
+from ansible.inventory.data import InventoryData  # noqa: E402
+from ansible.parsing.dataloader import DataLoader  # noqa: E402
+from ansible.plugins.loader import inventory_loader  # noqa: E402
+
+
+def write_config(directory, args):
+    path = os.path.join(directory, 'bench.dna_center.yml')
+    with open(path, 'w') as f:
+        f.write('plugin: dna_center\n')
+        f.write('host: dnac.invalid\n')
+        f.write("dnac_version: '2.2.3.3'\n")
+        f.write('username: admin\n')
+        f.write('password: admin\n')
+        f.write('validate_certs: false\n')
+        f.write('use_dnac_mgmt_int: true\n')
+        f.write('toplevel: dnac\n')
+        f.write('api_record_limit: %d\n' % args.record_limit)
+        f.write('api_workers: %d\n' % args.workers)
+    return path
+
+
+def expected_calls(fleet, record_limit):
+    '''
+        :return The API call budget of one parse: login, device count, pages and two topologies.
+    '''
+
+    return 2 + math.ceil(len(fleet.devices) / record_limit) + 2
+
+
+def run(fleet, config, args):
+    dna_center_stub.use(fleet, args.latency)
+
+    plugin = inventory_loader.get('dna_center')
+    inventory = InventoryData()
+
+    started = time.perf_counter()
+    plugin.parse(inventory, DataLoader(), config, cache=False)
+    inventory.reconcile_inventory()
+    elapsed = time.perf_counter() - started
+
+    return elapsed, inventory, dna_center_stub.CALLS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dna_center inventory plugin against an offline DNAC stub.')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='synthetic fleet sizes to benchmark (default: 1000 10000 50000)')
+    parser.add_argument('--fixture', help='replay the fleet saved in this JSON fixture instead of synthetic fleets')
+    parser.add_argument('--save-fixture', help='save the (last) synthetic fleet to this JSON fixture')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic fleets')
+    parser.add_argument('--record-limit', type=int, default=500, help='api_record_limit (default: 500)')
+    parser.add_argument('--workers', type=int, default=4, help='api_workers (default: 4)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every stub API call takes (default: 0)')
+    parser.add_argument('--repeat', type=int, default=1, help='parses per fleet; the fastest is reported')
+    parser.add_argument('--check', action='store_true', help='fail if a parse exceeds the expected API call budget')
+    args = parser.parse_args(argv)
+
+    inventory_loader.add_directory(PLUGIN_DIR)
+
+    if args.fixture:
+        fleets = [dna_center_stub.Fleet.load(args.fixture)]
+    else:
+        fleets = [dna_center_stub.Fleet.synthetic(count, seed=args.seed) for count in args.devices]
+        if args.save_fixture:
+            fleets[-1].save(args.save_fixture)
+
+    failed = False
+    print('%8s %8s %8s %6s %10s  %s' % ('devices', 'hosts', 'groups', 'calls', 'seconds', 'calls by method'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = write_config(directory, args)
+
+        for fleet in fleets:
+            results = [run(fleet, config, args) for _ in range(max(1, args.repeat))]
+            elapsed, inventory, calls = min(results, key=lambda result: result[0])
+
+            print('%8d %8d %8d %6d %10.3f  %s' % (
+                len(fleet.devices), len(inventory.hosts), len(inventory.groups), calls.total(), elapsed,
+                ' '.join('%s=%d' % item for item in sorted(calls.counts.items()))))
+
+            budget = expected_calls(fleet, args.record_limit)
+            if args.check and calls.total() > budget:
+                print('  FAIL: %d API calls, expected at most %d' % (calls.total(), budget), file=sys.stderr)
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
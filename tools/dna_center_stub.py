@@ -0,0 +1,205 @@
+'''
+Offline stand-in for the parts of dnacentersdk used by the dna_center inventory plugin.
+
+The stub serves a fleet of devices and sites from memory: either a synthetic fleet built by
+Fleet.synthetic() or one replayed from a JSON fixture written by Fleet.save(). Every API call
+is counted so that benchmarks can assert how many requests a parse makes.
+
+    import dna_center_stub
+    dna_center_stub.install()                         # registers the stub as 'dnacentersdk'
+    dna_center_stub.use(dna_center_stub.Fleet.synthetic(10000))
+'''
+
+import json
+import math
+import random
+import sys
+import threading
+import time
+import types
+
+
+class ApiError(Exception):
+    '''
+        Mirrors dnacentersdk.ApiError closely enough for the plugin's error handling.
+    '''
+
+    def __init__(self, status_code, message=''):
+        super(ApiError, self).__init__('[%d] %s' % (status_code, message))
+        self.status_code = status_code
+
+
+class Response(dict):
+    '''
+        Dictionary with attribute access, like the objects dnacentersdk returns.
+    '''
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Fleet:
+    '''
+        Devices, sites and physical topology nodes served by the stub.
+    '''
+
+    SOFTWARE = [('IOS-XE', 'Switches and Hubs'), ('IOS-XE', 'Routers'), ('NX-OS', 'Switches and Hubs'),
+                ('IOS', 'Switches and Hubs'), ('IOS-XR', 'Routers'), ('Cisco Controller', 'Wireless Controller')]
+    ROLES = ['ACCESS', 'DISTRIBUTION', 'CORE', 'BORDER ROUTER']
+    SERIES = ['Cisco Catalyst 9300 Series Switches', 'Cisco Nexus 9000 Series Switches',
+              'Cisco ASR 1000 Series Aggregation Services Routers', 'Cisco Catalyst 9800 Series Wireless Controllers']
+
+    def __init__(self, devices, sites, nodes):
+        self.devices = devices
+        self.sites = sites
+        self.nodes = nodes
+
+    @classmethod
+    def synthetic(cls, device_count, access_points=0.1, devices_per_floor=50, seed=0):
+        '''
+            :param device_count: Number of devices, including access points.
+            :param access_points: Fraction of devices that are Unified APs, which the plugin skips.
+            :param devices_per_floor: Devices per floor site; floors are grouped 4 to a building
+                                      and buildings 10 to an area under Global.
+            :return A Fleet with a Global > area > building > floor site tree.
+        '''
+
+        rng = random.Random(seed)
+
+        floors = max(1, math.ceil(device_count / devices_per_floor))
+        buildings = max(1, math.ceil(floors / 4))
+        areas = max(1, math.ceil(buildings / 10))
+
+        sites = [{'id': 'site-global', 'name': 'Global', 'parentId': None, 'locationType': 'area'}]
+        sites += [{'id': 'site-a%d' % a, 'name': 'Area %d' % a, 'parentId': 'site-global', 'locationType': 'area'}
+                  for a in range(areas)]
+        sites += [{'id': 'site-b%d' % b, 'name': 'Building %d' % b, 'parentId': 'site-a%d' % (b // 10), 'locationType': 'building'}
+                  for b in range(buildings)]
+        sites += [{'id': 'site-f%d' % f, 'name': 'Floor %d-%d' % (f // 4, f % 4), 'parentId': 'site-b%d' % (f // 4), 'locationType': 'floor'}
+                  for f in range(floors)]
+
+        devices = []
+        nodes = []
+        for i in range(device_count):
+            if rng.random() < access_points:
+                software, family = 'Cisco Controller', 'Unified AP'
+            else:
+                software, family = rng.choice(cls.SOFTWARE)
+
+            device_id = '%08x-0000-4000-8000-%012x' % (seed, i)
+            devices.append({
+                'id': device_id,
+                'hostname': 'dev-%06d.example.net' % i,
+                'managementIpAddress': '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+                'family': family,
+                'softwareType': software,
+                'softwareVersion': rng.choice(['16.12.4', '17.3.5', '17.6.1', '9.3(8)']),
+                'reachabilityStatus': 'Reachable' if rng.random() < 0.97 else 'Unreachable',
+                'role': rng.choice(cls.ROLES),
+                'serialNumber': ', '.join('FOC%08d' % rng.randrange(10 ** 8) for _ in range(rng.choice([1, 1, 2]))),
+                'series': rng.choice(cls.SERIES),
+                'platformId': 'C9300-48P',
+                'upTime': '%d days, 2:03:04.00' % rng.randrange(400),
+                'lastUpdateTime': 1700000000000 + i,
+            })
+            nodes.append({'id': device_id, 'additionalInfo': {'siteid': 'site-f%d' % (i // devices_per_floor)}})
+
+        return cls(devices, sites, nodes)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['devices'], data['sites'], data['nodes'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'devices': self.devices, 'sites': self.sites, 'nodes': self.nodes}, f)
+
+
+class Calls:
+    '''
+        Thread safe count of the API calls made, by SDK method name.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+FLEET = Fleet([], [], [])
+CALLS = Calls()
+LATENCY = 0.0
+
+
+def use(fleet, latency=0.0):
+    '''
+        Serve fleet from now on and reset the call counts.
+        :param latency: Seconds every API call sleeps, to model the round trip to DNA Center.
+    '''
+
+    global FLEET, CALLS, LATENCY
+    FLEET = fleet
+    CALLS = Calls()
+    LATENCY = latency
+
+
+def _request(name):
+    CALLS.add(name)
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+class Devices:
+
+    def get_device_count(self):
+        _request('get_device_count')
+        return Response(response=len(FLEET.devices))
+
+    def get_network_device_by_pagination_range(self, records_to_return, start_index):
+        _request('get_network_device_by_pagination_range')
+        if start_index < 1 or records_to_return < 1 or records_to_return > 500:
+            raise ApiError(400, 'invalid pagination range')
+        page = FLEET.devices[start_index - 1:start_index - 1 + records_to_return]
+        return Response(response=[Response(device) for device in page])
+
+
+class Topology:
+
+    def get_site_topology(self):
+        _request('get_site_topology')
+        return Response(response=Response(sites=[Response(site) for site in FLEET.sites]))
+
+    def get_physical_topology(self):
+        _request('get_physical_topology')
+        return Response(response=Response(nodes=[Response(node) for node in FLEET.nodes], links=[]))
+
+
+class DNACenterAPI:
+
+    def __init__(self, username=None, password=None, base_url=None, version=None, verify=True, session=None, **kwargs):
+        _request('authentication')
+        self.devices = Devices()
+        self.topology = Topology()
+
+
+def install():
+    '''
+        Register the stub as the dnacentersdk module so that the plugin imports it.
+    '''
+
+    module = types.ModuleType('dnacentersdk')
+    module.DNACenterAPI = DNACenterAPI
+    module.ApiError = ApiError
+    sys.modules['dnacentersdk'] = module
+    return module
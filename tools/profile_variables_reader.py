@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+'''
+Read the output of the profile_variables callback plugin and print it as full records.
+
+Accepts the pretty-printed summary (a JSON array), the JSON lines written by the stream
+output mode and the binary records written with `output_format = cbor`, each optionally
+gzip or zstd compressed. Records written with `record_mode = delta` are replayed per host
+so that every entry is printed with its complete task_arguments, task_variables and
+tracked_variables.
+
+    tools/profile_variables_reader.py /tmp/profile.ndjson
+    tools/profile_variables_reader.py --format ndjson /tmp/profile.ndjson > full.ndjson
+    tools/profile_variables_reader.py --host hosta --task Debug --var var_on_play /tmp/profile.cbor.gz
+'''
+
+import argparse
+import gzip
+import io
+import json
+import struct
+import sys
+
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+
+SECTIONS = ('task_arguments', 'task_variables', 'tracked_variables')
+
+CBOR_MAGIC = b'PVAR\x01'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def open_capture(path):
+    '''
+        :param path: Capture file, or - for stdin.
+        :return A buffered binary stream of the decompressed capture.
+    '''
+
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    raw = io.BufferedReader(raw) if not hasattr(raw, 'peek') else raw
+
+    head = raw.peek(4)[:4]
+    if head.startswith(GZIP_MAGIC):
+        return io.BufferedReader(gzip.GzipFile(fileobj=raw))
+    if head.startswith(ZSTD_MAGIC):
+        if not HAS_ZSTANDARD:
+            sys.exit('The zstandard Python library is required to read zstd compressed captures')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+    return raw
+
+
+def read_json_records(stream):
+    '''
+        :param stream: Text stream holding a JSON array or JSON lines.
+        :return A generator of the records in the stream.
+    '''
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        # The summary output mode writes a single (multi-line) JSON array
+        if line.startswith('['):
+            yield from json.loads(line + stream.read())
+            return
+
+        yield json.loads(line)
+
+
+class CborDecoder:
+    '''
+        Decoder for the subset of CBOR (RFC 8949) that the callback writes.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def argument(self, info):
+        if info < 24:
+            return info
+        size = {24: 1, 25: 2, 26: 4, 27: 8}[info]
+        value = int.from_bytes(self.data[self.pos:self.pos + size], 'big')
+        self.pos += size
+        return value
+
+    def load(self):
+        initial = self.data[self.pos]
+        self.pos += 1
+        major, info = initial >> 5, initial & 0x1f
+
+        if major == 7:
+            if info == 27:
+                value = struct.unpack('>d', self.data[self.pos:self.pos + 8])[0]
+                self.pos += 8
+                return value
+            return {20: False, 21: True, 22: None, 23: None}[info]
+
+        value = self.argument(info)
+        if major == 0:
+            return value
+        if major == 1:
+            return -1 - value
+        if major in (2, 3):
+            chunk = self.data[self.pos:self.pos + value]
+            self.pos += value
+            return bytes(chunk).decode('utf-8', 'replace') if major == 3 else bytes(chunk)
+        if major == 4:
+            return [self.load() for _ in range(value)]
+        if major == 5:
+            items = {}
+            for _ in range(value):
+                key = self.load()
+                items[key] = self.load()
+            return items
+        raise ValueError(f"Unsupported CBOR major type {major}")
+
+
+def read_cbor_records(stream):
+    '''
+        :param stream: Binary stream positioned after CBOR_MAGIC.
+        :return A generator of the records in the stream.
+    '''
+
+    strings = []
+    while True:
+        length = stream.read(4)
+        if len(length) < 4:
+            return
+
+        size = struct.unpack('>I', length)[0]
+        item = CborDecoder(stream.read(size)).load()
+
+        if item[0] == 0:
+            strings.append(item[1])
+        else:
+            _, host, task, event, body = item
+            record = {'host': strings[host], 'task': strings[task], 'event': strings[event]}
+            record.update(body)
+            yield record
+
+
+def read_records(stream):
+    '''
+        :param stream: Buffered binary stream returned by open_capture().
+        :return A generator of the records in the stream, whatever its format.
+    '''
+
+    if stream.peek(len(CBOR_MAGIC)).startswith(CBOR_MAGIC):
+        stream.read(len(CBOR_MAGIC))
+        return read_cbor_records(stream)
+    return read_json_records(io.TextIOWrapper(stream, encoding='utf-8'))
+
+
+class Timeline:
+    '''
+        Replays delta records into full records, keeping the current state of every host.
+    '''
+
+    def __init__(self):
+        # hostname -> {section: {name: value}}
+        self._hosts = {}
+
+    @staticmethod
+    def parse_pointer(path):
+        _, section, name = path.split('/', 2)
+        return section, name.replace('~1', '/').replace('~0', '~')
+
+    def apply(self, record):
+        '''
+            :param record: A full record or a delta record (one with a `patch` list).
+            :return The full record.
+        '''
+
+        if 'patch' not in record:
+            return record
+
+        state = self._hosts.setdefault(record['host'], dict((section, {}) for section in SECTIONS))
+
+        for operation in record['patch']:
+            section, name = self.parse_pointer(operation['path'])
+            if operation['op'] == 'remove':
+                state[section].pop(name, None)
+            else:
+                state[section][name] = operation['value']
+
+        full = dict((key, value) for key, value in record.items() if key != 'patch')
+        for section in SECTIONS:
+            full[section] = dict(state[section])
+
+        return full
+
+
+def select_records(records, hosts, tasks, variables):
+    '''
+        Filter full records by host name, task name substring and tracked variable name.
+    '''
+
+    for record in records:
+        if hosts and record.get('host') not in hosts:
+            continue
+        if tasks and not any(task in record.get('task', '') for task in tasks):
+            continue
+        if variables:
+            tracked = record.get('tracked_variables', {})
+            record = dict(record)
+            record['tracked_variables'] = dict((name, tracked[name]) for name in variables if name in tracked)
+        yield record
+
+
+def write_records(records, out, output_format):
+    if output_format == 'ndjson':
+        for record in records:
+            out.write(json.dumps(record, default=str, separators=(',', ':')) + '\n')
+        return
+
+    # Same layout as json.dumps(records, indent=4) without holding every record in memory
+    separator = '[\n'
+    for record in records:
+        out.write(separator)
+        out.write('\n'.join('    ' + line for line in json.dumps(record, indent=4, default=str).splitlines()))
+        separator = ',\n'
+    out.write('[]\n' if separator == '[\n' else '\n]\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the records captured by the profile_variables callback plugin.')
+    parser.add_argument('path', nargs='?', default='-', help='capture file, or - for stdin (default)')
+    parser.add_argument('--format', dest='output_format', choices=['json', 'ndjson'], default='json',
+                        help='output format (default: json)')
+    parser.add_argument('--host', dest='hosts', action='append', default=[],
+                        help='only print records of this host (repeatable)')
+    parser.add_argument('--task', dest='tasks', action='append', default=[],
+                        help='only print records of tasks whose name contains this text (repeatable)')
+    parser.add_argument('--var', dest='variables', action='append', default=[],
+                        help='only print this tracked variable (repeatable)')
+    args = parser.parse_args(argv)
+
+    timeline = Timeline()
+    hosts = set(args.hosts)
+
+    with open_capture(args.path) as stream:
+        # Hosts are replayed independently, so other hosts' records can be dropped before replaying
+        records = (record for record in read_records(stream) if not hosts or record.get('host') in hosts)
+        records = (timeline.apply(record) for record in records)
+        write_records(select_records(records, hosts, args.tasks, args.variables), sys.stdout, args.output_format)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+'''
+Benchmark the cost of unsafe-wrapped values when the controller imports an inventory.
+
+Times `ansible-inventory --list` against inventories/dynamic_inventory_windows.py for the
+given host counts, once per fraction of {"__ansible_unsafe": ...} wrapped values (by default
+plain and fully wrapped), and reports the wall-clock time, the peak RSS and the overhead over
+the first fraction. The script's own document is generated and cached before the timed runs,
+so only the import by ansible-inventory is measured.
+
+    tools/unsafe_inventory_bench.py --hosts 1000 10000 50000
+    tools/unsafe_inventory_bench.py --hosts 10000 --unsafe 0 0.25 0.5 1 --repeat 3
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'inventories', 'dynamic_inventory_windows.py')
+
+
+def ansible_inventory():
+    '''
+        :return The ansible-inventory next to the running interpreter, or the one on the PATH.
+    '''
+
+    candidate = os.path.join(os.path.dirname(sys.executable), 'ansible-inventory')
+    return candidate if os.access(candidate, os.X_OK) else shutil.which('ansible-inventory')
+
+
+def run(command, env):
+    '''
+        :return The wall-clock seconds and peak RSS in MB of the command.
+    '''
+
+    # a file rather than a pipe, so the warnings of a large run cannot block the command
+    with tempfile.TemporaryFile() as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+
+        if os.waitstatus_to_exitcode(status) != 0:
+            stderr.seek(0)
+            raise SystemExit('%s failed:\n%s' % (' '.join(command), stderr.read().decode('utf-8', 'replace')))
+
+    return elapsed, usage.ru_maxrss / 1024.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time ansible-inventory --list on plain and unsafe-wrapped inventories.')
+    parser.add_argument('--hosts', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='host counts to benchmark (default: 1000 10000 50000)')
+    parser.add_argument('--unsafe', type=float, nargs='+', default=[0.0, 1.0],
+                        help='fractions of wrapped values; overheads are relative to the first (default: 0 1)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per variant; the fastest is reported')
+    parser.add_argument('--ansible-inventory', default=ansible_inventory(), help='ansible-inventory executable')
+    args = parser.parse_args(argv)
+
+    if not args.ansible_inventory:
+        parser.error('ansible-inventory not found, use --ansible-inventory')
+
+    print('%8s %7s %10s %9s %9s' % ('hosts', 'unsafe', 'seconds', 'rss MB', 'overhead'))
+
+    with tempfile.TemporaryDirectory() as cache:
+        for hosts in args.hosts:
+            baseline = None
+
+            for fraction in args.unsafe:
+                env = dict(os.environ, INVENTORY_CACHE_DIR=cache,
+                           WINDOWS_INVENTORY_COUNT=str(hosts), WINDOWS_INVENTORY_UNSAFE=str(fraction))
+
+                # build the cached document outside of the timed runs
+                run([sys.executable, SCRIPT, '--list'], env)
+
+                results = [run([args.ansible_inventory, '-i', SCRIPT, '--list'], env) for _ in range(max(1, args.repeat))]
+                elapsed, rss = min(results)
+
+                baseline = baseline or elapsed
+                print('%8d %7.2f %10.3f %9.1f %8.1f%%' % (hosts, fraction, elapsed, rss, 100.0 * (elapsed / baseline - 1)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())